@@ -0,0 +1,158 @@
+"""
+Nutrition analytics for AI Calorie Tracker
+Per-day rollups and meals loaded once into columnar frames; trends, breakdowns and goal adherence are vectorized
+"""
+
+import numpy as np
+import pandas as pd
+
+MACROS = ("protein", "carbs", "fat")
+CALORIES_PER_GRAM = {"protein": 4, "carbs": 4, "fat": 9}
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+GOAL_TOLERANCE = 0.1  # Within 10% of the goal counts as on target
+
+
+def _numbers(values) -> np.ndarray:
+    """Float array with missing or non-numeric values as 0"""
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").fillna(0).to_numpy(dtype=float)
+
+
+class NutritionFrame:
+    """Meal history as two frames: one row per meal and one row per food
+
+    The meal dicts are walked once to fill the columns; everything after that is
+    pandas/NumPy operations over whole columns.
+    """
+
+    def __init__(self, meals: list):
+        food_counts = np.fromiter((len(meal.get('foods') or []) for meal in meals), dtype=int, count=len(meals))
+        foods = [food for meal in meals for food in (meal.get('foods') or [])]
+
+        self.meals = pd.DataFrame({
+            'date': pd.to_datetime([meal['date'] for meal in meals]),
+            'meal_type': pd.Categorical([meal.get('meal_type') for meal in meals], categories=MEAL_TYPES, ordered=True),
+            'calories': _numbers([meal.get('total_calories') for meal in meals])
+        })
+        self.foods = pd.DataFrame({
+            'date': np.repeat(self.meals['date'].to_numpy(), food_counts),
+            **{macro: _numbers([food.get(macro) for food in foods]) for macro in MACROS}
+        })
+
+    def __len__(self):
+        return len(self.meals)
+
+    def daily(self) -> pd.DataFrame:
+        """Per-day calories and macros, indexed by date"""
+        daily = self.meals.groupby('date')[['calories']].sum()
+        return daily.join(self.foods.groupby('date')[list(MACROS)].sum()).fillna(0)
+
+    @property
+    def days(self) -> int:
+        return self.meals['date'].nunique()
+
+
+def daily_frame(rows: list) -> pd.DataFrame:
+    """Per-day calories and macros, indexed by date, from daily_nutrition rollup rows"""
+    return pd.DataFrame({
+        'calories': _numbers([row.get('total_calories') for row in rows]),
+        **{macro: _numbers([row.get(macro) for row in rows]) for macro in MACROS}
+    }, index=pd.DatetimeIndex(pd.to_datetime([row['date'] for row in rows]), name='date'))
+
+
+class Insights:
+    """Everything the Insights tab shows
+
+    Trends, macros, weekdays and adherence come from per-day totals covering all history;
+    the meal-type breakdown needs individual meals, so it covers the meals in frame.
+    """
+
+    def __init__(self, daily: pd.DataFrame, frame: NutritionFrame, meal_count: int = None):
+        self.meal_count = len(frame) if meal_count is None else meal_count
+        self.daily = self._daily(daily)
+        self.meal_type_days = frame.days
+        self.meal_types = self._meal_types(frame, self.meal_type_days)
+        self.macros = self._macros(self.daily)
+        self.weekdays = self._weekdays(self.daily)
+        self._adherence = {}
+
+    @classmethod
+    def from_meals(cls, meals: list) -> "Insights":
+        """Insights from a complete meal history"""
+        frame = NutritionFrame(meals)
+        return cls(frame.daily(), frame)
+
+    @classmethod
+    def from_rollup(cls, rows: list, meals: list) -> "Insights":
+        """Insights from daily_nutrition rows, with meal types from the meals at hand"""
+        meal_count = sum(int(row.get('meal_count') or 0) for row in rows)
+        return cls(daily_frame(rows), NutritionFrame(meals), meal_count)
+
+    @staticmethod
+    def _daily(daily: pd.DataFrame) -> pd.DataFrame:
+        """Per-day totals with 7/30-day rolling calorie averages over logged days"""
+        daily = daily.sort_index()
+        # Time-based windows: days with nothing logged are skipped rather than counted as zero
+        daily['avg_7d'] = daily['calories'].rolling("7D").mean()
+        daily['avg_30d'] = daily['calories'].rolling("30D").mean()
+        return daily
+
+    @staticmethod
+    def _meal_types(frame: NutritionFrame, days: int) -> pd.DataFrame:
+        """Meals, average calories per meal and per logged day, and share of calories per meal type"""
+        grouped = frame.meals.groupby('meal_type', observed=True)['calories']
+        breakdown = pd.DataFrame({'meals': grouped.size(), 'per_meal': grouped.mean(), 'total': grouped.sum()})
+        breakdown['per_day'] = breakdown['total'] / max(days, 1)
+        breakdown['share'] = breakdown['total'] / max(breakdown['total'].sum(), 1)
+        return breakdown.drop(columns='total')
+
+    @staticmethod
+    def _macros(daily: pd.DataFrame) -> pd.DataFrame:
+        """Average grams per logged day and share of macro calories"""
+        grams = daily[list(MACROS)]
+        kcal = grams.sum() * pd.Series(CALORIES_PER_GRAM)
+        return pd.DataFrame({'grams_per_day': grams.mean(), 'share': kcal / kcal.sum()}).fillna(0.0)
+
+    @staticmethod
+    def _weekdays(daily: pd.DataFrame) -> pd.DataFrame:
+        """Average calories and logged-day count by day of week"""
+        grouped = daily['calories'].groupby(daily.index.dayofweek)
+        weekdays = pd.DataFrame({'calories': grouped.mean(), 'days': grouped.size()}).reindex(range(7))
+        # Ordered so charts keep Monday..Sunday rather than sorting the names
+        weekdays.index = pd.CategoricalIndex(WEEKDAYS, categories=WEEKDAYS, ordered=True)
+        return weekdays.fillna({'days': 0})
+
+    def adherence(self, goal: float) -> dict:
+        """How logged days compare with a daily calorie goal (memoized per goal)"""
+        if goal not in self._adherence:
+            calories = self.daily['calories'].to_numpy()
+            low, high = goal * (1 - GOAL_TOLERANCE), goal * (1 + GOAL_TOLERANCE)
+            on_target = (calories >= low) & (calories <= high)
+            # Current run of consecutive logged days at or under the goal's upper bound
+            over = np.flatnonzero(calories > high)
+            streak = len(calories) - (over[-1] + 1) if len(over) else len(calories)
+            self._adherence[goal] = {
+                'days': len(calories),
+                'on_target': int(on_target.sum()),
+                'over': int((calories > high).sum()),
+                'under': int((calories < low).sum()),
+                'on_target_rate': float(on_target.mean()) if len(calories) else 0.0,
+                'avg_difference': float((calories - goal).mean()) if len(calories) else 0.0,
+                'streak': int(streak)
+            }
+        return self._adherence[goal]
+
+
+class InsightsCache:
+    """Insights kept until the data version stamp changes, so reruns don't recompute history"""
+
+    def __init__(self):
+        self.version = None
+        self.insights = None
+
+    def get(self, version, build) -> Insights:
+        """Cached insights for version, rebuilt by build() when the stamp differs"""
+        if self.insights is None or version != self.version:
+            self.insights = build()
+            self.version = version
+        return self.insights
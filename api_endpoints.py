@@ -6,9 +6,13 @@ Add these functions to your Streamlit app
 import streamlit as st
 import json
 import base64
-from openai import OpenAI
 from datetime import datetime
 import requests
+from analysis_cache import get_analysis_cache
+from openai_gateway import get_openai_gateway
+from metrics import get_metrics
+from clients import get_openai_client
+from food_analysis import FoodAnalyzer
 
 def create_api_endpoints():
     """Add API endpoints to Streamlit app"""
@@ -38,53 +42,10 @@ def handle_photo_analysis():
         if 'image_data' in st.experimental_get_query_params():
             image_data = st.experimental_get_query_params()['image_data'][0]
             
-            # Initialize OpenAI client
-            client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-            
-            # Analyze the image
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": """Analyze this food image and provide a detailed nutritional breakdown. You MUST respond with ONLY valid JSON in exactly this format:
-
-{
-    "foods": [
-        {
-            "name": "food item name",
-            "portion_size": "estimated portion (e.g., '1 cup', '150g', '1 medium')",
-            "calories": 200,
-            "protein": 15.5,
-            "carbs": 25.0,
-            "fat": 8.0,
-            "fiber": 3.0,
-            "sugar": 5.0,
-            "sodium": 150.0,
-            "confidence": 85
-        }
-    ],
-    "total_calories": 200,
-    "notes": "any additional observations about the meal"
-}"""
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000
-            )
-            
-            # Parse and return the response
-            analysis_result = json.loads(response.choices[0].message.content)
+            # Same engine (prompt, budget, parsing, cache) as the Streamlit app
+            client = get_openai_client(st.secrets["OPENAI_API_KEY"])
+            analyzer = FoodAnalyzer()
+            analysis_result = analyzer.analyze(client, analyzer.prepare_bytes(base64.b64decode(image_data)))
             
             # Return JSON response
             st.json(analysis_result)
@@ -115,7 +76,10 @@ def handle_health_check():
     st.json({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "service": "CalorieAI API"
+        "service": "CalorieAI API",
+        "analysis_cache": get_analysis_cache().stats(),
+        "openai_gateway": get_openai_gateway().stats(),
+        "metrics": get_metrics().snapshot()
     })
 
 # Add this to your main Streamlit app
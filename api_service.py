@@ -0,0 +1,198 @@
+"""
+Analysis API service for AI Calorie Tracker
+ASGI app serving /analyze, /foods, /config, /health and /metrics to the PWA without Streamlit script reruns
+
+    uvicorn api_service:app --host 0.0.0.0 --port 8000
+
+Photos are POSTed as multipart/form-data (an "image" file field) or as the raw request
+body (image/jpeg, image/png, application/octet-stream). Add ?stream=1 (or send
+Accept: application/x-ndjson) to receive foods line by line as they are recognized.
+Reads OPENAI_API_KEY, SUPABASE_URL and SUPABASE_ANON_KEY from the environment.
+"""
+
+import json
+import os
+from datetime import datetime
+from PIL import Image, UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from analysis_cache import get_analysis_cache
+from openai_gateway import get_openai_gateway
+from metrics import get_metrics, timed
+from clients import get_async_openai_client
+from food_analysis import FoodAnalyzer, AnalysisParseError
+from food_database import get_food_index
+from image_processing import DEFAULT_MAX_EDGE, DEFAULT_FORMAT, DEFAULT_QUALITY, DEFAULT_TARGET_BYTES
+
+MAX_UPLOAD_BYTES = int(os.environ.get("API_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+ALLOWED_ORIGINS = os.environ.get("API_ALLOWED_ORIGINS", "https://eylonl.github.io").split(",")
+READ_CHUNK = 64 * 1024
+METRICS_ENDPOINT = os.environ.get("METRICS_ENDPOINT", "1") not in ("0", "false")
+
+
+class UploadTooLarge(Exception):
+    """Request body is bigger than MAX_UPLOAD_BYTES"""
+
+
+async def read_upload(request: Request) -> bytes:
+    """Image bytes from a multipart "image"/"file" field or the raw body, capped at MAX_UPLOAD_BYTES"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge()
+
+    buffer = bytearray()
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        async with request.form(max_files=1) as form:
+            upload = form.get("image") or form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise ValueError("Multipart body needs an 'image' file field")
+            while chunk := await upload.read(READ_CHUNK):
+                buffer += chunk
+                if len(buffer) > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge()
+    else:
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge()
+
+    if not buffer:
+        raise ValueError("No image data provided")
+    return bytes(buffer)
+
+
+# Built once; FoodAnalyzer is stateless apart from its shared cache
+analyzer = FoodAnalyzer(
+    max_edge=int(os.environ.get("IMAGE_MAX_EDGE", DEFAULT_MAX_EDGE)),
+    fmt=os.environ.get("IMAGE_FORMAT", DEFAULT_FORMAT),
+    quality=int(os.environ.get("IMAGE_QUALITY", DEFAULT_QUALITY)),
+    target_bytes=int(os.environ.get("IMAGE_TARGET_BYTES", DEFAULT_TARGET_BYTES))
+)
+
+
+def wants_stream(request: Request) -> bool:
+    """Streaming is requested with ?stream=1 or Accept: application/x-ndjson"""
+    return (request.query_params.get("stream") in ("1", "true")
+            or "application/x-ndjson" in request.headers.get("accept", ""))
+
+
+async def stream_analysis(client, prepared):
+    """NDJSON lines: one {"type": "food"} per recognized item, then {"type": "analysis"} or {"type": "error"}"""
+    try:
+        async for event in analyzer.analyze_stream_async(client, prepared):
+            yield json.dumps(event) + "\n"
+    except Exception as e:
+        yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+
+@timed("api.analyze", failed=lambda response: response.status_code >= 400)
+async def analyze(request: Request):
+    """POST /analyze: nutritional analysis of one food photo (streamed as NDJSON on request)"""
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        return JSONResponse({"error": "OpenAI API key not configured"}, status_code=500)
+
+    try:
+        data = await read_upload(request)
+    except UploadTooLarge:
+        return JSONResponse({"error": f"Image larger than {MAX_UPLOAD_BYTES} bytes"}, status_code=413)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        # Decoding and downscaling are CPU-bound: keep them off the event loop
+        prepared = await run_in_threadpool(analyzer.prepare_bytes, data)
+    except Image.DecompressionBombError:
+        # Small file, enormous dimensions: refuse before decoding it (Pillow raises above twice
+        # MAX_IMAGE_PIXELS and only warns below that)
+        return JSONResponse({"error": f"Image dimensions exceed {2 * Image.MAX_IMAGE_PIXELS} pixels"}, status_code=413)
+    except (UnidentifiedImageError, OSError):
+        return JSONResponse({"error": "Could not read image"}, status_code=400)
+
+    client = get_async_openai_client(api_key)
+    if wants_stream(request):
+        return StreamingResponse(stream_analysis(client, prepared), media_type="application/x-ndjson")
+
+    try:
+        analysis = await analyzer.analyze_async(client, prepared)
+    except AnalysisParseError as e:
+        return JSONResponse({"error": str(e), "raw_response": e.response_text[:500]}, status_code=502)
+    except Exception as e:
+        return JSONResponse({"error": f"Analysis failed: {e}"}, status_code=502)
+    return JSONResponse(analysis)
+
+
+async def foods(request: Request) -> JSONResponse:
+    """GET /foods?q=...&portion=...: type-ahead food database search (unreadable portions get one serving)"""
+    food_index = get_food_index()
+    try:
+        limit = min(int(request.query_params.get("limit", 8)), 50)
+    except ValueError:
+        return JSONResponse({"error": "limit must be an integer"}, status_code=400)
+    portion = request.query_params.get("portion")
+    results = []
+    for food_id in food_index.search(request.query_params.get("q", ""), limit=limit):
+        food = food_index.food(food_id, portion) or food_index.food(food_id)
+        results.append(dict(food, serving=food_index.servings[food_id]))
+    return JSONResponse({"foods": results})
+
+
+async def config(request: Request) -> JSONResponse:
+    """GET /config: Supabase settings for the PWA"""
+    supabase_url = os.environ.get("SUPABASE_URL")
+    return JSONResponse({
+        "supabase_url": supabase_url or "NOT_FOUND",
+        "supabase_anon_key": os.environ.get("SUPABASE_ANON_KEY", "NOT_FOUND"),
+        "features": {
+            "supabase_enabled": bool(supabase_url),
+            "ai_analysis_enabled": bool(os.environ.get("OPENAI_API_KEY"))
+        }
+    })
+
+
+async def health(request: Request) -> JSONResponse:
+    """GET /health: liveness plus analysis cache and OpenAI gateway stats"""
+    return JSONResponse({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "service": "CalorieAI API",
+        "analysis_cache": await run_in_threadpool(get_analysis_cache().stats),
+        "openai_gateway": get_openai_gateway().stats(),
+        "metrics": get_metrics().snapshot()
+    })
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    """GET /metrics: Prometheus text format (disable with METRICS_ENDPOINT=0)"""
+    cache_stats = await run_in_threadpool(get_analysis_cache().stats)
+    gauges = {f"openai_gateway_{name}": value for name, value in get_openai_gateway().stats().items()}
+    gauges.update({f"analysis_cache_{name}": value for name, value in cache_stats.items()})
+    return PlainTextResponse(get_metrics().prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(
+    routes=[
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/foods", foods, methods=["GET"]),
+        Route("/config", config, methods=["GET"]),
+        Route("/health", health, methods=["GET"])
+    ] + ([Route("/metrics", metrics, methods=["GET"])] if METRICS_ENDPOINT else []),
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=ALLOWED_ORIGINS,
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type"]
+        )
+    ]
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("API_HOST", "0.0.0.0"), port=int(os.environ.get("API_PORT", 8000)))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Backfill thumbnail and medium photo variants for meals saved before variants existed
+
+Reads Supabase credentials from .streamlit/secrets.toml, like the app:
+
+    python backfill_thumbnails.py [--limit N]
+"""
+
+import argparse
+from supabase_client import SupabaseManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate missing meal photo variants in Supabase Storage")
+    parser.add_argument("--limit", type=int, default=None, help="process at most this many meals")
+    args = parser.parse_args()
+
+    manager = SupabaseManager()
+    if not manager.is_connected():
+        raise SystemExit("Could not connect to Supabase; check .streamlit/secrets.toml")
+
+    def progress(done, total):
+        print(f"\r{done}/{total} meals processed", end="", flush=True)
+
+    backfilled, skipped = manager.backfill_photo_variants(limit=args.limit, progress=progress)
+    print(f"\nBackfilled variants for {backfilled} meals")
+    for meal_id, error in skipped:
+        print(f"Skipped meal {meal_id}: {error}")
+
+
+if __name__ == "__main__":
+    main()
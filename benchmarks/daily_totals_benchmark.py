@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark: client-side daily totals vs. database-side aggregation
+
+Uses an in-memory SQLite database as a local stand-in for Postgres, loaded with
+the same meals/foods shape as supabase_schema.sql. Each path JSON-encodes and
+decodes its result rows to account for the PostgREST payload, and the payload
+is converted to an estimated transfer time for a mobile-grade link.
+
+    python benchmarks/daily_totals_benchmark.py --meals 5000 --days 730
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import time
+import uuid
+from datetime import date, timedelta
+
+SCHEMA = """
+CREATE TABLE meals (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    total_calories INTEGER NOT NULL
+);
+CREATE TABLE foods (
+    id TEXT PRIMARY KEY,
+    meal_id TEXT REFERENCES meals(id) ON DELETE CASCADE,
+    calories INTEGER, protein REAL, carbs REAL, fat REAL,
+    fiber REAL, sugar REAL, sodium REAL
+);
+CREATE INDEX idx_meals_user_date ON meals(user_id, date DESC);
+CREATE INDEX idx_foods_meal_id ON foods(meal_id);
+"""
+
+# Same aggregation as public.get_daily_nutrition: foods are summed per meal before the day rollup
+DAILY_NUTRITION_SQL = """
+SELECT m.date, COUNT(*), SUM(m.total_calories),
+       COALESCE(SUM(mf.protein), 0), COALESCE(SUM(mf.carbs), 0), COALESCE(SUM(mf.fat), 0),
+       COALESCE(SUM(mf.fiber), 0), COALESCE(SUM(mf.sugar), 0), COALESCE(SUM(mf.sodium), 0)
+FROM meals m
+LEFT JOIN (
+    SELECT meal_id, SUM(protein) AS protein, SUM(carbs) AS carbs, SUM(fat) AS fat,
+           SUM(fiber) AS fiber, SUM(sugar) AS sugar, SUM(sodium) AS sodium
+    FROM foods
+    WHERE meal_id IN (SELECT id FROM meals WHERE user_id = :user AND date >= :start AND date <= :end)
+    GROUP BY meal_id
+) mf ON mf.meal_id = m.id
+WHERE m.user_id = :user AND m.date >= :start AND m.date <= :end
+GROUP BY m.date ORDER BY m.date
+"""
+
+COLUMNS = ["date", "meal_count", "total_calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium"]
+
+
+def populate(conn, meals: int, days: int, foods_per_meal: int):
+    """Fill the stand-in database with random meals spread over `days` days"""
+    conn.executescript(SCHEMA)
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=days - 1)
+    meal_rows, food_rows = [], []
+    for _ in range(meals):
+        meal_id = str(uuid.uuid4())
+        meal_date = (start + timedelta(days=rng.randrange(days))).isoformat()
+        calories = 0
+        for _ in range(foods_per_meal):
+            food_calories = rng.randint(50, 600)
+            calories += food_calories
+            food_rows.append((str(uuid.uuid4()), meal_id, food_calories,
+                              rng.uniform(0, 40), rng.uniform(0, 80), rng.uniform(0, 30),
+                              rng.uniform(0, 10), rng.uniform(0, 30), rng.uniform(0, 900)))
+        meal_rows.append((meal_id, "default_user", meal_date, calories))
+    conn.executemany("INSERT INTO meals VALUES (?, ?, ?, ?)", meal_rows)
+    conn.executemany("INSERT INTO foods VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", food_rows)
+    conn.commit()
+    return start
+
+
+def client_side(conn, start: date, end: date):
+    """Current path: fetch every (date, total_calories) row and sum in Python"""
+    rows = conn.execute(
+        "SELECT date, total_calories FROM meals WHERE user_id = ? AND date >= ? AND date <= ?",
+        ("default_user", start.isoformat(), end.isoformat())
+    ).fetchall()
+    payload = json.dumps([{"date": d, "total_calories": c} for d, c in rows])
+    daily_totals = {}
+    for meal in json.loads(payload):
+        daily_totals[meal["date"]] = daily_totals.get(meal["date"], 0) + meal["total_calories"]
+    return daily_totals, len(payload)
+
+
+def server_side(conn, start: date, end: date):
+    """New path: aggregate per day in the database and decode one row per day"""
+    params = {"user": "default_user", "start": start.isoformat(), "end": end.isoformat()}
+    rows = conn.execute(DAILY_NUTRITION_SQL, params).fetchall()
+    payload = json.dumps([dict(zip(COLUMNS, row)) for row in rows])
+    daily_totals = {row["date"]: row["total_calories"] for row in json.loads(payload)}
+    return daily_totals, len(payload)
+
+
+def bench(fn, repeat: int, *args):
+    """Best wall time over `repeat` runs, plus the last result"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--meals", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--foods-per-meal", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mbps", type=float, default=10.0, help="link bandwidth for the transfer estimate")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    start = populate(conn, args.meals, args.days, args.foods_per_meal)
+    end = date.today()
+
+    client_time, (client_totals, client_bytes) = bench(client_side, args.repeat, conn, start, end)
+    server_time, (server_totals, server_bytes) = bench(server_side, args.repeat, conn, start, end)
+    assert client_totals == server_totals, "aggregation paths disagree"
+
+    def transfer_ms(payload_bytes):
+        return payload_bytes * 8 / (args.mbps * 1_000_000) * 1000
+
+    print(f"{args.meals} meals over {args.days} days ({len(server_totals)} days with meals), {args.mbps:g} Mbps link")
+    print(f"{'':16}{'query+decode':>14}{'payload':>14}{'transfer':>12}{'total':>12}")
+    for label, elapsed, size in (("client-side sum", client_time, client_bytes),
+                                 ("server-side RPC", server_time, server_bytes)):
+        print(f"{label:16}{elapsed * 1000:11.2f} ms{size:>8,} bytes{transfer_ms(size):9.1f} ms"
+              f"{elapsed * 1000 + transfer_ms(size):9.1f} ms")
+    print("(server-side rows also carry protein/carbs/fat/fiber/sugar/sodium)")
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,21 @@ def create_static_build():
     files_to_copy = [
         "calorie_tracker_app.py",
         "supabase_client.py", 
+        "meal_cache.py",
+        "image_processing.py",
+        "analysis_cache.py",
+        "clients.py",
+        "food_analysis.py",
+        "openai_gateway.py",
+        "metrics.py",
+        "analytics.py",
+        "food_database.py",
+        "food_nutrition.csv",
+        "portions.py",
+        "frequent_meals.py",
+        "photo_uploads.py",
+        "local_storage.py",
+        "sqlite_store.py",
         "manifest.json",
         "requirements.txt"
     ]
@@ -1,13 +1,42 @@
 import streamlit as st
-import openai
 from PIL import Image
 import json
 import base64
 from datetime import datetime, date
-from openai import OpenAI
 from supabase_client import SupabaseManager
+from meal_cache import MealCache
+from image_processing import DEFAULT_MAX_EDGE, DEFAULT_FORMAT, DEFAULT_QUALITY, DEFAULT_TARGET_BYTES
+from analysis_cache import get_analysis_cache
+from openai_gateway import get_openai_gateway
+from metrics import get_metrics, timed
+from clients import get_openai_client
+from photo_uploads import get_photo_upload_queue
+from local_storage import get_local_store, SNAPSHOT_PATH, JOURNAL_PATH
+from sqlite_store import LocalStoreManager, DEFAULT_DB_PATH
+from food_analysis import FoodAnalyzer, AnalysisParseError
+from analytics import Insights, InsightsCache
+from food_database import get_food_index
+from portions import follow_portion, rescale, scale_nutrients
 import os
 
+HISTORY_DAYS_PER_PAGE = 7
+
+def get_setting(name, default):
+    """Read an optional setting from Streamlit secrets"""
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+def get_food_analyzer():
+    """Analysis engine configured from the IMAGE_* settings"""
+    return FoodAnalyzer(
+        max_edge=int(get_setting("IMAGE_MAX_EDGE", DEFAULT_MAX_EDGE)),
+        fmt=get_setting("IMAGE_FORMAT", DEFAULT_FORMAT),
+        quality=int(get_setting("IMAGE_QUALITY", DEFAULT_QUALITY)),
+        target_bytes=int(get_setting("IMAGE_TARGET_BYTES", DEFAULT_TARGET_BYTES))
+    )
+
 # API Endpoints for PWA
 def handle_api_requests():
     """Handle API requests from PWA"""
@@ -62,53 +91,10 @@ def handle_api_requests():
                 if 'image_data' in query_params:
                     image_data = query_params.get('image_data')
                     
-                    # Initialize OpenAI client
-                    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-                    
-                    # Analyze the image
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": """Analyze this food image and provide a detailed nutritional breakdown. You MUST respond with ONLY valid JSON in exactly this format:
-
-{
-    "foods": [
-        {
-            "name": "food item name",
-            "portion_size": "estimated portion (e.g., '1 cup', '150g', '1 medium')",
-            "calories": 200,
-            "protein": 15.5,
-            "carbs": 25.0,
-            "fat": 8.0,
-            "fiber": 3.0,
-            "sugar": 5.0,
-            "sodium": 150.0,
-            "confidence": 85
-        }
-    ],
-    "total_calories": 200,
-    "notes": "any additional observations about the meal"
-}"""
-                                    },
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{image_data}"
-                                        }
-                                    }
-                                ]
-                            }
-                        ],
-                        max_tokens=1000
-                    )
-                    
-                    # Parse and return the response
-                    analysis_result = json.loads(response.choices[0].message.content)
+                    # Same engine (prompt, budget, parsing, cache) as the in-app analysis
+                    client = get_openai_client(st.secrets["OPENAI_API_KEY"])
+                    analyzer = get_food_analyzer()
+                    analysis_result = analyzer.analyze(client, analyzer.prepare_bytes(base64.b64decode(image_data)))
                     st.json(analysis_result)
                     st.stop()
                 else:
@@ -123,7 +109,10 @@ def handle_api_requests():
             st.json({
                 "status": "healthy",
                 "timestamp": datetime.now().isoformat(),
-                "service": "CalorieAI API"
+                "service": "CalorieAI API",
+                "analysis_cache": get_analysis_cache().stats(),
+                "openai_gateway": get_openai_gateway().stats(),
+                "metrics": get_metrics().snapshot()
             })
             st.stop()
 
@@ -261,145 +250,86 @@ if 'daily_totals' not in st.session_state:
 if 'use_supabase' not in st.session_state:
     st.session_state.use_supabase = st.session_state.supabase_manager.is_connected()
 
-def load_meal_history():
-    """Load meal history from JSON file"""
-    if os.path.exists('meal_history.json'):
-        try:
-            with open('meal_history.json', 'r') as f:
-                data = json.load(f)
-                st.session_state.meal_history = data.get('meals', [])
-                st.session_state.daily_totals = data.get('daily_totals', {})
-        except Exception as e:
-            st.error(f"Error loading meal history: {e}")
+def create_meal_store():
+    """Database-backed meal store: Supabase when connected, else SQLite if configured
+    
+    Returns None when meals live in the local JSON journal instead.
+    """
+    if st.session_state.use_supabase:
+        return st.session_state.supabase_manager
+    if get_setting("LOCAL_STORE_BACKEND", "json") != "sqlite":
+        return None
+    
+    store = LocalStoreManager(get_setting("LOCAL_DB_PATH", DEFAULT_DB_PATH))
+    if not store.is_connected():
+        return None
+    # First run on SQLite: bring over any existing JSON history (a small one may
+    # still be entirely in the journal, before its first compaction into the snapshot)
+    if not store.get_meals(limit=1) and (os.path.exists(SNAPSHOT_PATH) or os.path.exists(JOURNAL_PATH)):
+        meals = get_local_store().meal_history()
+        if meals:
+            migrated = store.migrate_from_json({"meals": meals})
+            st.toast(f"Imported {migrated} meals into the local database")
+    return store
 
-def save_meal_history():
-    """Save meal history to JSON file"""
+if 'meal_store' not in st.session_state:
+    st.session_state.meal_store = create_meal_store()
+
+def load_meal_history():
+    """Load meal history from the local journaled store"""
     try:
-        data = {
-            'meals': st.session_state.meal_history,
-            'daily_totals': st.session_state.daily_totals
-        }
-        with open('meal_history.json', 'w') as f:
-            json.dump(data, f, indent=2)
+        store = get_local_store()
+        st.session_state.meal_history = store.meal_history()
+        st.session_state.daily_totals = store.daily_totals()
     except Exception as e:
-        st.error(f"Error saving meal history: {e}")
+        st.error(f"Error loading meal history: {e}")
 
-def encode_image(image):
-    """Convert PIL image to base64 string for OpenAI API"""
-    buffered = io.BytesIO()
-    image.save(buffered, format="JPEG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
-
-def analyze_food_with_openai(image, api_key):
-    """Analyze food image using OpenAI GPT-4 Vision"""
+@timed("analyze_food_with_openai", failed=lambda result: result is None)
+def analyze_food_with_openai(image, api_key, on_food=None):
+    """Analyze food image using OpenAI GPT-4 Vision
+    
+    With on_food, the reply is streamed and on_food(food) is called as each item is recognized.
+    """
     try:
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Convert image to base64
-        base64_image = encode_image(image)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Analyze this food image and provide a detailed nutritional breakdown. You MUST respond with ONLY valid JSON in exactly this format, with no additional text before or after:
-
-{
-    "foods": [
-        {
-            "name": "food item name",
-            "portion_size": "estimated portion (e.g., '1 cup', '150g', '1 medium')",
-            "calories": 200,
-            "protein": 15.5,
-            "carbs": 25.0,
-            "fat": 8.0,
-            "fiber": 3.0,
-            "sugar": 5.0,
-            "sodium": 150.0,
-            "confidence": 85
-        }
-    ],
-    "total_calories": 200,
-    "notes": "any additional observations about the meal"
-}
-
-Important: 
-- Return ONLY the JSON object, no explanatory text
-- Include ALL nutritional values: protein, carbs, fat, fiber, sugar (in grams), sodium (in mg)
-- Be as accurate as possible with portion sizes and nutritional estimates
-- Use realistic numbers with decimals for nutrition (e.g., 15.5g protein)
-- Calories should be integers, nutrition can be decimals
-- Confidence should be 0-100 (integer)
-- If you're unsure about nutrition values, use reasonable estimates based on typical food composition
-- If you're unsure, indicate lower confidence"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
-        
-        # Parse the JSON response with better error handling
-        response_text = response.choices[0].message.content
+        analyzer = get_food_analyzer()
+        client = get_openai_client(api_key)
+        if on_food is None:
+            # Re-analyzing the same photo is answered from the cache without an API call
+            return analyzer.analyze(client, image)
         
-        if not response_text:
-            st.error("Empty response from OpenAI")
-            return None
+        for event in analyzer.analyze_stream(client, image):
+            if event["type"] == "food":
+                on_food(event["food"])
+            else:
+                return event["analysis"]
         
-        # Try to extract JSON from response
-        try:
-            # First, try to parse the entire response as JSON
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            # If that fails, try to extract JSON from within the text
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx == -1 or end_idx == 0:
-                # No JSON found, create a fallback response
-                st.warning("Could not parse AI response. Using fallback analysis.")
-                return {
-                    "foods": [
-                        {
-                            "name": "Unknown food item",
-                            "portion_size": "1 serving",
-                            "calories": 300,
-                            "confidence": 50
-                        }
-                    ],
-                    "total_calories": 300,
-                    "notes": f"AI response could not be parsed. Raw response: {response_text[:200]}..."
-                }
-            
-            json_str = response_text[start_idx:end_idx]
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError as json_error:
-                st.error(f"JSON parsing failed: {json_error}")
-                st.error(f"Raw response: {response_text}")
-                return None
+    except AnalysisParseError as e:
+        st.error(f"Could not read the AI analysis: {e}")
+        return None
         
     except Exception as e:
         st.error(f"Error analyzing image: {e}")
         return None
 
-def add_meal_to_history(meal_data, meal_type, photo_image=None):
-    """Add confirmed meal to history"""
-    today = date.today().isoformat()
+def analyze_food_batch(images, api_key, progress=None):
+    """Analyze several photos concurrently; returns an analysis (or None on failure) per photo"""
+    try:
+        results = get_food_analyzer().analyze_batch(get_openai_client(api_key), images, progress=progress)
+    except Exception as e:
+        st.error(f"Error analyzing images: {e}")
+        return [None] * len(images)
     
+    analyses = []
+    for n, (analysis, error) in enumerate(results, 1):
+        if error is not None:
+            st.warning(f"Photo {n} could not be analyzed: {error}")
+        analyses.append(analysis)
+    return analyses
+
+def add_meal_to_history(meal_data, meal_type, photo_image=None, meal_date=None):
+    """Add confirmed meal to history (dated today unless meal_date is given)"""
     meal_entry = {
-        'date': today,
+        'date': (meal_date or date.today()).isoformat(),
         'timestamp': datetime.now().isoformat(),
         'meal_type': meal_type,
         'foods': meal_data['foods'],
@@ -407,71 +337,248 @@ def add_meal_to_history(meal_data, meal_type, photo_image=None):
         'notes': meal_data.get('notes', '')
     }
     
-    # Use Supabase if available
-    if st.session_state.use_supabase:
+    # Use Supabase (or the local SQLite database) if available
+    if st.session_state.meal_store is not None:
         try:
-            # Upload photo if provided
-            photo_url = None
-            if photo_image:
-                temp_meal_id = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                photo_url = st.session_state.supabase_manager.upload_photo(photo_image, temp_meal_id)
+            manager = st.session_state.meal_store
+            upload_photo = photo_image is not None and st.session_state.use_supabase
             
-            # Save to Supabase
-            meal_id = st.session_state.supabase_manager.save_meal(meal_entry, photo_url)
+            # Save the meal first; the photo follows in the background
+            meal_id = manager.save_meal(meal_entry, photo_status="pending" if upload_photo else None)
             if meal_id:
-                st.success("✅ Meal saved to cloud database!")
-                # Refresh data from Supabase
-                load_meals_from_supabase()
+                if upload_photo and not get_photo_upload_queue().submit(manager, photo_image, meal_id):
+                    # Upload queue is full: upload inline rather than drop the photo
+                    try:
+                        photo_urls = manager.upload_photo(photo_image, meal_id)
+                        if photo_urls:
+                            manager.set_photo_urls(meal_id, photo_urls)
+                        else:
+                            manager.mark_photo_failed(meal_id)
+                    except Exception as e:
+                        # The meal is saved either way; don't fall back to local storage
+                        st.warning(f"Meal saved, but its photo could not be stored: {e}")
+                        try:
+                            manager.mark_photo_failed(meal_id)
+                        except Exception:
+                            pass
+                if st.session_state.use_supabase:
+                    st.success("✅ Meal saved to cloud database!")
+                else:
+                    st.success("✅ Meal saved to local database!")
+                # Pull the new row into the meal cache
+                load_meals_from_store(force=True)
                 return
             else:
-                st.warning("Failed to save to cloud, using local storage as backup")
+                st.warning("Failed to save to database, using local storage as backup")
         except Exception as e:
-            st.warning(f"Cloud save failed ({e}), using local storage")
+            st.warning(f"Database save failed ({e}), using local storage")
     
     # Fallback to local storage
-    st.session_state.meal_history.append(meal_entry)
-    
-    # Update daily totals
-    if today not in st.session_state.daily_totals:
-        st.session_state.daily_totals[today] = 0
-    st.session_state.daily_totals[today] += meal_data['total_calories']
-    
-    save_meal_history()
+    try:
+        get_local_store().add(meal_entry)
+        load_meal_history()
+    except Exception as e:
+        st.error(f"Error saving meal history: {e}")
 
-def load_meals_from_supabase():
-    """Load meals from Supabase database"""
-    if not st.session_state.use_supabase:
+def load_meals_from_store(force=False):
+    """Sync meals from the meal store through the session meal cache"""
+    if st.session_state.meal_store is None:
         return
     
     try:
-        meals = st.session_state.supabase_manager.get_meals()
-        daily_totals = st.session_state.supabase_manager.get_daily_totals()
+        if 'meal_cache' not in st.session_state:
+            st.session_state.meal_cache = MealCache(st.session_state.meal_store)
         
-        # Convert Supabase format to local format
-        converted_meals = []
-        for meal in meals:
-            converted_meal = {
-                'id': meal['id'],  # Add Supabase ID for editing/deleting
-                'date': meal['date'],
-                'timestamp': meal['timestamp'],
-                'meal_type': meal['meal_type'],
-                'total_calories': meal['total_calories'],
-                'notes': meal['notes'] or '',
-                'photo_url': meal.get('photo_url'),
-                'foods': meal.get('foods', [])
-            }
-            converted_meals.append(converted_meal)
+        # First page once per session, then only fetch rows changed since the last sync
+        cache = st.session_state.meal_cache
+        cache.sync(force=force)
         
-        st.session_state.meal_history = converted_meals
-        st.session_state.daily_totals = daily_totals
+        st.session_state.meal_history = cache.meal_history()
+        st.session_state.daily_totals = cache.daily_totals
         
     except Exception as e:
-        st.error(f"Error loading meals from Supabase: {e}")
+        st.error(f"Error loading meals: {e}")
+
+def add_manual_food(food):
+    """Put a food into the first empty manual entry row (or a new one), prefilling its inputs"""
+    rows = st.session_state.manual_foods
+    i = next((n for n, row in enumerate(rows) if not st.session_state.get(f"manual_name_{n}")), len(rows))
+    if i == len(rows):
+        rows.append({})
+    rows[i] = food
+    st.session_state[f"manual_name_{i}"] = food['name']
+    st.session_state[f"manual_portion_{i}"] = food['portion_size']
+    st.session_state[f"manual_calories_{i}"] = food['calories']
+
+def manual_food(entry, name, portion_size, calories):
+    """Manual entry row as a food; a database food's macros follow edits to its portion and calories
+    
+    Macros are dropped when the row was renamed or its new portion can't be compared with the
+    database serving, rather than saved for a different amount of food.
+    """
+    food = {"name": name, "portion_size": portion_size, "calories": calories,
+            "confidence": 100}  # Manual entry is 100% confident
+    if entry.get('name') != name:
+        return food
+    scaled = entry
+    if portion_size != entry.get('portion_size'):
+        scaled = rescale(entry, portion_size)
+        if scaled is None:
+            return food
+    if calories == entry.get('calories'):
+        # Calories left as prefilled: they follow the portion too
+        return dict(scaled, **dict(food, calories=scaled['calories']))
+    if not scaled.get('calories'):
+        return food
+    return dict(scale_nutrients(scaled, calories / scaled['calories']), **food)
+
+def render_food_search():
+    """Type-ahead lookup in the bundled food database; adds the chosen food to the manual entry"""
+    food_index = get_food_index()
+    if st.session_state.pop('food_search_added', False):
+        # Start the next lookup from scratch (widget state can only be reset before it renders)
+        st.session_state.food_search = ""
+        st.session_state.food_search_portion = ""
+    query = st.text_input("🔎 Quick add from food database", key="food_search",
+                          placeholder="e.g., banana, greek yogurt, white rice")
+    if not query:
+        return
+    matches = food_index.search(query)
+    if not matches:
+        st.caption("No matching foods. Enter it manually below.")
+        return
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        choice = st.selectbox("Food", matches, key="food_search_choice",
+                              format_func=lambda i: f"{food_index.names[i]} ({food_index.servings[i]})")
+    with col2:
+        portion = st.text_input("Portion", key="food_search_portion", placeholder=food_index.servings[choice])
+    
+    food = food_index.food(choice, portion)
+    if food is None:
+        st.warning(f"Couldn't read that portion. Try grams (150g) or servings ({food_index.servings[choice]}).")
+        return
+    st.caption(f"{food['calories']} cal • Protein {food['protein']}g • Carbs {food['carbs']}g • Fat {food['fat']}g")
+    if st.button("➕ Add to Meal", key="food_search_add", use_container_width=True):
+        add_manual_food(food)
+        st.session_state.food_search_added = True
+        st.rerun()
+
+def frequent_meal_suggestions(meal_type):
+    """Meals logged again and again lately, best matches for meal_type first"""
+    if st.session_state.meal_store is None:
+        return get_local_store().suggestions(meal_type)
+    if 'meal_cache' not in st.session_state:
+        return []
+    return st.session_state.meal_cache.frequent_meals.suggestions(meal_type)
+
+def render_frequent_meals(meal_type):
+    """One-tap re-logging of usual meals: no photo, upload or AI analysis"""
+    suggestions = frequent_meal_suggestions(meal_type)
+    if not suggestions:
+        return
+    
+    st.markdown("**🔁 Log Again:**")
+    for n, meal in enumerate(suggestions):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown(f"**{', '.join(food['name'] for food in meal['foods'])}**")
+            st.caption(f"{meal['total_calories']} cal • logged {meal['count']} times")
+        with col2:
+            if st.button("➕ Log", key=f"relog_{n}", use_container_width=True):
+                add_meal_to_history(meal, meal_type)
+                st.rerun()
+
+def analytics_version():
+    """Stamp that changes whenever the meal data behind the Insights tab changes
+    
+    Syncs that find nothing new and paging older history into the cache keep the stamp.
+    """
+    if st.session_state.meal_store is not None:
+        cache = st.session_state.meal_cache
+        return ("store", id(cache), cache.data_version)
+    return ("local", get_local_store().version)
+
+def build_insights():
+    """Insights from the daily_nutrition rollup, with meal types from the cached meals
+    
+    The rollup is one row per day, so long histories are never downloaded meal by meal.
+    """
+    if st.session_state.meal_store is None:
+        return Insights.from_meals(get_local_store().meal_history())
+    meals = list(st.session_state.meal_cache.meals.values())
+    rows = st.session_state.meal_store.get_daily_nutrition()
+    if not rows:
+        # No rollup to read (schema predates it): fall back to the cached window
+        return Insights.from_meals(meals)
+    return Insights.from_rollup(rows, meals)
+
+@timed("render_insights")
+def render_insights(daily_goal):
+    """Trends, meal-type and macro breakdowns, weekday patterns and goal adherence"""
+    if 'insights_cache' not in st.session_state:
+        st.session_state.insights_cache = InsightsCache()
+    insights = st.session_state.insights_cache.get(analytics_version(), build_insights)
+    
+    if not insights.meal_count:
+        st.info("Log a few meals to see your trends here.")
+        return
+    
+    daily = insights.daily
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("7-Day Average", f"{daily['avg_7d'].iloc[-1]:.0f} cal")
+    with col2:
+        st.metric("30-Day Average", f"{daily['avg_30d'].iloc[-1]:.0f} cal")
+    with col3:
+        st.metric("Days Logged", len(daily))
+    
+    st.subheader("Daily Calorie Trends")
+    st.line_chart(daily[['calories', 'avg_7d', 'avg_30d']].rename(columns={
+        'calories': 'Calories', 'avg_7d': '7-day average', 'avg_30d': '30-day average'
+    }))
+    
+    if daily_goal > 0:
+        st.subheader("Goal Adherence")
+        adherence = insights.adherence(daily_goal)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("On Target", f"{adherence['on_target_rate']:.0%}",
+                      help=f"Days within 10% of {daily_goal} calories")
+        with col2:
+            st.metric("Average vs Goal", f"{adherence['avg_difference']:+.0f} cal")
+        with col3:
+            st.metric("Streak", f"{adherence['streak']} days", help="Consecutive logged days not over the goal")
+        st.caption(f"{adherence['on_target']} on target • {adherence['over']} over • "
+                   f"{adherence['under']} under, out of {adherence['days']} logged days")
+    
+    st.subheader("Macros")
+    macros = insights.macros
+    col1, col2 = st.columns(2)
+    with col1:
+        st.bar_chart(macros['grams_per_day'].rename("Grams per day"))
+    with col2:
+        for macro, row in macros.iterrows():
+            st.write(f"**{macro.title()}**: {row['grams_per_day']:.0f} g/day ({row['share']:.0%} of macro calories)")
+    
+    st.subheader("By Meal Type")
+    meal_types = insights.meal_types
+    if insights.meal_type_days < len(daily):
+        st.caption(f"Based on the {insights.meal_type_days} most recent logged days")
+    st.bar_chart(meal_types['per_day'].rename("Calories per day"))
+    st.dataframe(meal_types.rename(columns={
+        'meals': 'Meals', 'per_meal': 'Avg per meal', 'per_day': 'Avg per day', 'share': 'Share'
+    }).style.format({'Avg per meal': '{:.0f}', 'Avg per day': '{:.0f}', 'Share': '{:.0%}'}),
+        use_container_width=True)
+    
+    st.subheader("By Day of Week")
+    st.bar_chart(insights.weekdays['calories'].rename("Average calories"))
 
 def main():
     # Load meal history on startup
-    if st.session_state.use_supabase:
-        load_meals_from_supabase()
+    if st.session_state.meal_store is not None:
+        load_meals_from_store()
     else:
         load_meal_history()
     
@@ -507,6 +614,12 @@ def main():
         if st.session_state.use_supabase:
             st.success("☁️ Connected to Supabase Cloud")
             st.caption("✅ Photos saved • ✅ Data persistent • ✅ Cloud backup")
+            if st.button("🔄 Reload from cloud", use_container_width=True):
+                st.session_state.meal_cache.invalidate()
+                st.rerun()
+        elif st.session_state.meal_store is not None:
+            st.info("🗄️ Using Local SQLite Database")
+            st.caption("⚠️ No photos saved • ✅ Data persistent")
         else:
             st.warning("📱 Using Local Storage")
             st.caption("⚠️ No photos saved • ⚠️ Data may be lost on restart")
@@ -525,7 +638,7 @@ def main():
             st.write(f"Remaining: {remaining:.0f} calories")
     
     # Main content tabs
-    tab1, tab2 = st.tabs(["📸 Add Meal", "📊 History"])
+    tab1, tab2, tab3 = st.tabs(["📸 Add Meal", "📊 History", "📈 Insights"])
     
     with tab1:
         st.markdown("### 🍽️ Add New Meal")
@@ -534,6 +647,9 @@ def main():
         st.markdown("**Select Meal Type:**")
         meal_type = st.selectbox("", ["Breakfast", "Lunch", "Dinner", "Snack"], label_visibility="collapsed")
         
+        # Usual meals are cloned from history instead of photographed and analyzed again
+        render_frequent_meals(meal_type)
+        
         # iPhone-optimized camera section
         st.markdown("---")
         st.markdown("### 📸 Capture Your Meal")
@@ -546,6 +662,24 @@ def main():
         st.markdown("**Or choose from your photos:**")
         uploaded_file = st.file_uploader("📁 Select Image", type=['jpg', 'jpeg', 'png'], label_visibility="collapsed")
         
+        # Batch mode: analyze a day's worth of photos in one go
+        with st.expander("📚 Add several photos at once"):
+            batch_files = st.file_uploader("Select Images", type=['jpg', 'jpeg', 'png'], accept_multiple_files=True,
+                                           key="batch_files", label_visibility="collapsed")
+            if batch_files and st.button(f"🔍 Analyze {len(batch_files)} Photos", use_container_width=True):
+                batch_images = [Image.open(batch_file) for batch_file in batch_files]
+                progress_bar = st.progress(0.0, text="🧠 AI is analyzing your meals...")
+                analyses = analyze_food_batch(
+                    batch_images, api_key,
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"🧠 Analyzed {done}/{total} photos")
+                )
+                st.session_state.batch_analyses = [
+                    {'image': image, 'analysis': analysis, 'meal_type': meal_type}
+                    for image, analysis in zip(batch_images, analyses) if analysis
+                ]
+                if st.session_state.batch_analyses:
+                    st.rerun()
+        
         # Manual entry option
         st.markdown("---")
         st.markdown("### ✏️ Manual Entry")
@@ -559,6 +693,13 @@ def main():
         if st.session_state.get('show_manual_entry', False):
             st.markdown("#### 🍽️ Enter Meal Details")
             
+            # Initialize manual foods in session state
+            if 'manual_foods' not in st.session_state:
+                st.session_state.manual_foods = [{"name": "", "portion": "", "calories": 0}]
+            
+            # Common foods come straight from the bundled database: no AI call needed
+            render_food_search()
+            
             with st.form("manual_meal_entry"):
                 # Date selection
                 meal_date = st.date_input("📅 Meal Date", value=date.today())
@@ -566,10 +707,6 @@ def main():
                 # Manual food entry
                 st.markdown("**Add Food Items:**")
                 
-                # Initialize manual foods in session state
-                if 'manual_foods' not in st.session_state:
-                    st.session_state.manual_foods = [{"name": "", "portion": "", "calories": 0}]
-                
                 manual_foods = []
                 total_manual_calories = 0
                 
@@ -582,16 +719,12 @@ def main():
                     with col2:
                         portion_size = st.text_input("Portion", key=f"manual_portion_{i}", placeholder="e.g., 150g")
                     with col3:
-                        calories = st.number_input("Calories", min_value=0, key=f"manual_calories_{i}", value=0)
+                        calories = st.number_input("Calories", min_value=0, key=f"manual_calories_{i}")
                     
                     if food_name:  # Only add if name is provided
-                        manual_foods.append({
-                            "name": food_name,
-                            "portion_size": portion_size or "1 serving",
-                            "calories": calories,
-                            "confidence": 100  # Manual entry is 100% confident
-                        })
-                        total_manual_calories += calories
+                        manual_foods.append(manual_food(st.session_state.manual_foods[i], food_name,
+                                                        portion_size or "1 serving", calories))
+                        total_manual_calories += manual_foods[-1]['calories']
                 
                 # Buttons to add/remove food items
                 col1, col2 = st.columns(2)
@@ -624,24 +757,7 @@ def main():
                         }
                         
                         # Add to history with custom date
-                        meal_entry = {
-                            'date': meal_date.isoformat(),
-                            'timestamp': datetime.now().isoformat(),
-                            'meal_type': meal_type,
-                            'foods': manual_meal_data['foods'],
-                            'total_calories': manual_meal_data['total_calories'],
-                            'notes': manual_meal_data['notes']
-                        }
-                        
-                        st.session_state.meal_history.append(meal_entry)
-                        
-                        # Update daily totals
-                        date_str = meal_date.isoformat()
-                        if date_str not in st.session_state.daily_totals:
-                            st.session_state.daily_totals[date_str] = 0
-                        st.session_state.daily_totals[date_str] += manual_meal_data['total_calories']
-                        
-                        save_meal_history()
+                        add_meal_to_history(manual_meal_data, meal_type, meal_date=meal_date)
                         
                         st.success(f"✅ Manual meal saved! Total calories: {total_manual_calories}")
                         
@@ -674,14 +790,25 @@ def main():
             # Large, prominent analyze button for mobile
             st.markdown("### 🤖 AI Analysis")
             if st.button("🔍 Analyze My Meal", type="primary", use_container_width=True):
-                with st.spinner("🧠 AI is analyzing your meal..."):
-                    analysis = analyze_food_with_openai(image_to_analyze, api_key)
-                    
-                    if analysis:
-                        st.session_state.current_analysis = analysis
-                        st.session_state.current_meal_type = meal_type
-                        st.session_state.current_image = image_to_analyze  # Store image for Supabase
-                        st.rerun()
+                # Show foods as the model recognizes them instead of a spinner for the whole reply
+                st.markdown("---")
+                st.markdown("### ✅ Review & Confirm")
+                status = st.empty()
+                status.info("🧠 AI is analyzing your meal...")
+                recognized = st.container()
+                
+                def show_food(food):
+                    status.info("🧠 Still looking... foods found so far:")
+                    recognized.markdown(f"🥘 **{food['name']}** · {food['portion_size']} · {food['calories']} cal")
+                
+                analysis = analyze_food_with_openai(image_to_analyze, api_key, on_food=show_food)
+                status.empty()
+                
+                if analysis:
+                    st.session_state.current_analysis = analysis
+                    st.session_state.current_meal_type = meal_type
+                    st.session_state.current_image = image_to_analyze  # Store image for Supabase
+                    st.rerun()
         
         # Display analysis results for confirmation
         if 'current_analysis' in st.session_state:
@@ -718,7 +845,8 @@ def main():
                     
                     confidence = st.slider("AI Confidence %", 0, 100, food['confidence'], key=f"confidence_{i}")
                     
-                    confirmed_foods.append({
+                    # A new portion with the calories left alone rescales the nutrients instead of re-analyzing
+                    confirmed = follow_portion(food, {
                         'name': food['name'],
                         'portion_size': portion,
                         'calories': calories,
@@ -730,7 +858,10 @@ def main():
                         'sodium': sodium,
                         'confidence': confidence
                     })
-                    total_calories += calories
+                    if confirmed['calories'] != calories:
+                        st.caption(f"⚖️ Rescaled to {portion}: {confirmed['calories']} cal")
+                    confirmed_foods.append(confirmed)
+                    total_calories += confirmed['calories']
                     
                     st.markdown("---")  # Separator between foods
                 
@@ -740,6 +871,14 @@ def main():
                 # Total calories display
                 st.markdown(f"### 🔥 Total Calories: **{total_calories}**")
                 
+                # Show rescaled values in the fields before saving
+                if st.form_submit_button("⚖️ Update for New Portions", use_container_width=True):
+                    st.session_state.current_analysis = dict(analysis, foods=confirmed_foods)
+                    for i in range(len(confirmed_foods)):
+                        for field in ("calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium"):
+                            st.session_state.pop(f"{field}_{i}", None)
+                    st.rerun()
+                
                 # Mobile-optimized buttons
                 if st.form_submit_button("✅ Save This Meal", type="primary", use_container_width=True):
                         confirmed_meal = {
@@ -765,6 +904,65 @@ def main():
                     del st.session_state.current_meal_type
                     st.rerun()
     
+        # Review a batch of analyzed photos together
+        if st.session_state.get('batch_analyses'):
+            st.markdown("---")
+            st.markdown(f"### ✅ Review & Confirm {len(st.session_state.batch_analyses)} Meals")
+            meal_types = ["Breakfast", "Lunch", "Dinner", "Snack"]
+            
+            with st.form("confirm_batch"):
+                batch_date = st.date_input("Date for these meals", value=date.today())
+                meals_to_save = []
+                
+                for n, item in enumerate(st.session_state.batch_analyses):
+                    st.markdown(f"#### 📷 Meal {n+1}")
+                    st.image(item['image'], width=200)
+                    include = st.checkbox("Save this meal", value=True, key=f"batch_include_{n}")
+                    batch_meal_type = st.selectbox("Meal Type", meal_types, index=meal_types.index(item['meal_type']),
+                                                   key=f"batch_type_{n}")
+                    
+                    batch_foods = []
+                    batch_total = 0
+                    for i, food in enumerate(item['analysis']['foods']):
+                        col1, col2, col3 = st.columns([2, 1, 1])
+                        with col1:
+                            food_name = st.text_input("Food Name", value=food['name'], key=f"batch_name_{n}_{i}")
+                        with col2:
+                            portion = st.text_input("Portion", value=food['portion_size'], key=f"batch_portion_{n}_{i}")
+                        with col3:
+                            calories = st.number_input("Calories", value=int(food['calories']), min_value=0,
+                                                       key=f"batch_calories_{n}_{i}")
+                        if food_name:
+                            # Macros come from the analysis, rescaled if only the portion was changed
+                            batch_food = follow_portion(food, dict(food, name=food_name, portion_size=portion, calories=calories))
+                            batch_foods.append(batch_food)
+                            batch_total += batch_food['calories']
+                    
+                    st.markdown(f"**🔥 {batch_total} calories**")
+                    if include and batch_foods:
+                        meals_to_save.append((item, batch_meal_type, batch_foods, batch_total))
+                    st.markdown("---")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    save_batch = st.form_submit_button("✅ Save All", type="primary", use_container_width=True)
+                with col2:
+                    discard_batch = st.form_submit_button("❌ Discard", use_container_width=True)
+            
+            if save_batch:
+                for item, batch_meal_type, batch_foods, batch_total in meals_to_save:
+                    add_meal_to_history({
+                        'foods': batch_foods,
+                        'total_calories': batch_total,
+                        'notes': item['analysis'].get('notes', '')
+                    }, batch_meal_type, item['image'], batch_date)
+                st.success(f"Saved {len(meals_to_save)} meals!")
+                del st.session_state.batch_analyses
+                st.rerun()
+            if discard_batch:
+                del st.session_state.batch_analyses
+                st.rerun()
+    
     with tab2:
         st.header("Meal History")
         
@@ -774,7 +972,7 @@ def main():
             # Filter options
             col1, col2 = st.columns(2)
             with col1:
-                date_filter = st.date_input("Filter by Date (optional)")
+                date_filter = st.date_input("Filter by Date (optional)", value=None)
             with col2:
                 meal_type_filter = st.selectbox("Filter by Meal Type", ["All", "Breakfast", "Lunch", "Dinner", "Snack"])
             
@@ -782,7 +980,11 @@ def main():
             filtered_meals = st.session_state.meal_history
             
             if date_filter:
-                filtered_meals = [m for m in filtered_meals if m['date'] == date_filter.isoformat()]
+                if st.session_state.meal_store is not None:
+                    # The date may be older than the loaded window
+                    filtered_meals = st.session_state.meal_cache.meals_for_date(date_filter.isoformat())
+                else:
+                    filtered_meals = [m for m in filtered_meals if m['date'] == date_filter.isoformat()]
             
             if meal_type_filter != "All":
                 filtered_meals = [m for m in filtered_meals if m['meal_type'] == meal_type_filter]
@@ -793,12 +995,19 @@ def main():
             for meal in filtered_meals:
                 meals_by_date[meal['date']].append(meal)
             
-            # Sort dates in descending order (most recent first)
+            # Sort dates in descending order (most recent first) and render one window of days
             sorted_dates = sorted(meals_by_date.keys(), reverse=True)
+            if 'history_days' not in st.session_state:
+                st.session_state.history_days = HISTORY_DAYS_PER_PAGE
+            visible_dates = sorted_dates[:st.session_state.history_days]
             
-            for date_str in sorted_dates:
+            for date_str in visible_dates:
                 daily_meals = meals_by_date[date_str]
-                daily_total = sum(meal['total_calories'] for meal in daily_meals)
+                if meal_type_filter == "All":
+                    # Precomputed per-day total (daily_nutrition rollup or the local store's totals)
+                    daily_total = st.session_state.daily_totals.get(date_str, 0)
+                else:
+                    daily_total = sum(meal['total_calories'] for meal in daily_meals)
                 
                 # Convert date string to readable format
                 date_obj = datetime.fromisoformat(date_str + "T00:00:00").date()
@@ -820,10 +1029,23 @@ def main():
                         # Display photo if available
                         if meal.get('photo_url'):
                             st.markdown("**📸 Meal Photo:**")
+                            # Thumbnail first; the full-size photo is only fetched on request
+                            show_full = st.session_state.get(f"full_photo_{meal_id}", False)
                             try:
-                                st.image(meal['photo_url'], caption=f"{meal['meal_type']} photo", use_column_width=True)
+                                if meal.get('photo_thumb_url') and not show_full:
+                                    st.image(meal['photo_thumb_url'], caption=f"{meal['meal_type']} photo")
+                                elif show_full:
+                                    st.image(meal.get('photo_medium_url') or meal['photo_url'],
+                                             caption=f"{meal['meal_type']} photo", use_column_width=True)
+                                    st.markdown(f"[Open original]({meal['photo_url']})")
                             except Exception as e:
                                 st.caption("📷 Photo unavailable")
+                            if not show_full:
+                                if st.button("🔍 View full photo", key=f"view_photo_{meal_id}"):
+                                    st.session_state[f"full_photo_{meal_id}"] = True
+                                    st.rerun()
+                        elif meal.get('photo_status') == 'pending':
+                            st.caption("📤 Photo uploading...")
                         
                         # Display meal details
                         st.write("**🍽️ Foods:**")
@@ -867,43 +1089,39 @@ def main():
                         with col2:
                             if st.button("🗑️ Delete", key=f"delete_{meal_id}", use_container_width=True, type="secondary"):
                                 # Delete from Supabase if available
-                                if st.session_state.use_supabase and meal.get('id'):
+                                if st.session_state.meal_store is not None and meal.get('id'):
                                     try:
-                                        success = st.session_state.supabase_manager.delete_meal(meal['id'])
+                                        success = st.session_state.meal_store.delete_meal(meal['id'])
                                         if success:
                                             st.success(f"🗑️ Deleted {meal['meal_type']} ({meal['total_calories']} calories)")
-                                            # Refresh data from Supabase
-                                            load_meals_from_supabase()
+                                            # Drop it from the meal cache
+                                            st.session_state.meal_cache.remove(meal['id'])
+                                            load_meals_from_store()
                                             st.rerun()
                                         else:
-                                            st.error("Failed to delete meal from cloud database")
+                                            st.error("Failed to delete meal from database")
                                     except Exception as e:
                                         st.error(f"Error deleting meal: {e}")
                                 else:
                                     # Fallback to local storage deletion
-                                    meal_to_remove = None
-                                    for i, hist_meal in enumerate(st.session_state.meal_history):
-                                        if (hist_meal['date'] == date_str and 
-                                            hist_meal['timestamp'] == meal['timestamp'] and
-                                            hist_meal['meal_type'] == meal['meal_type']):
-                                            meal_to_remove = i
-                                            break
-                                    
-                                    if meal_to_remove is not None:
-                                        # Remove from local history
-                                        removed_meal = st.session_state.meal_history.pop(meal_to_remove)
-                                        
-                                        # Update daily totals
-                                        st.session_state.daily_totals[date_str] -= removed_meal['total_calories']
-                                        if st.session_state.daily_totals[date_str] <= 0:
-                                            del st.session_state.daily_totals[date_str]
-                                        
-                                        save_meal_history()
-                                        st.success(f"🗑️ Deleted {removed_meal['meal_type']} ({removed_meal['total_calories']} calories)")
+                                    if get_local_store().delete(meal['id']):
+                                        load_meal_history()
+                                        st.success(f"🗑️ Deleted {meal['meal_type']} ({meal['total_calories']} calories)")
                                         st.rerun()
                 
                 st.divider()  # Add separator between days
             
+            # Older days: render more of what's loaded, paging in from the meal store when needed
+            more_in_store = st.session_state.meal_store is not None and st.session_state.meal_cache.has_more
+            if not date_filter and (len(sorted_dates) > len(visible_dates) or more_in_store):
+                if st.button("⬇️ Load older days", use_container_width=True):
+                    st.session_state.history_days += HISTORY_DAYS_PER_PAGE
+                    if st.session_state.meal_store is not None:
+                        cache = st.session_state.meal_cache
+                        while cache.has_more and cache.loaded_days() < st.session_state.history_days:
+                            cache.load_more()
+                    st.rerun()
+            
             # Edit meal form (appears when editing)
             if 'editing_meal' in st.session_state:
                 st.markdown("---")
@@ -950,13 +1168,17 @@ def main():
                             calories = st.number_input("Calories", value=food['calories'], min_value=0, key=f"edit_calories_{i}")
                         
                         if food_name:  # Only add if name is provided
-                            edited_foods.append({
-                                "name": food_name,
-                                "portion_size": portion_size,
-                                "calories": calories,
-                                "confidence": food.get('confidence', 100)
-                            })
-                            total_edited_calories += calories
+                            # Keep the food's ID and macros so the update only rewrites changed rows;
+                            # a new portion with unchanged calories rescales them
+                            edited_food = follow_portion(food, dict(
+                                food,
+                                name=food_name,
+                                portion_size=portion_size,
+                                calories=calories,
+                                confidence=food.get('confidence', 100)
+                            ))
+                            edited_foods.append(edited_food)
+                            total_edited_calories += edited_food['calories']
                     
                     # Buttons to add/remove food items
                     col1, col2 = st.columns(2)
@@ -990,7 +1212,7 @@ def main():
                         if st.form_submit_button("✅ Save Changes", type="primary", use_container_width=True):
                             if edited_foods and any(food['name'] for food in edited_foods):
                                 # Update in Supabase if available
-                                if st.session_state.use_supabase and meal.get('id'):
+                                if st.session_state.meal_store is not None and meal.get('id'):
                                     try:
                                         updated_meal_data = {
                                             'date': new_date.isoformat(),
@@ -1000,53 +1222,31 @@ def main():
                                             'notes': new_notes
                                         }
                                         
-                                        success = st.session_state.supabase_manager.update_meal(meal['id'], updated_meal_data)
+                                        success = st.session_state.meal_store.update_meal(meal['id'], updated_meal_data)
                                         if success:
                                             st.success(f"✅ Meal updated! New total: {total_edited_calories} calories")
-                                            # Refresh data from Supabase
-                                            load_meals_from_supabase()
+                                            # Pull the updated row into the meal cache
+                                            load_meals_from_store(force=True)
                                             # Clear editing state
                                             del st.session_state.editing_meal
                                             del st.session_state.editing_foods
                                             st.rerun()
                                         else:
-                                            st.error("Failed to update meal in cloud database")
+                                            st.error("Failed to update meal in database")
                                     except Exception as e:
                                         st.error(f"Error updating meal: {e}")
                                 else:
                                     # Fallback to local storage update
-                                    original_date = editing_data['date_str']
-                                    meal_to_edit = None
+                                    updated = get_local_store().update(meal['id'], {
+                                        'date': new_date.isoformat(),
+                                        'meal_type': new_meal_type,
+                                        'foods': [food for food in edited_foods if food['name']],
+                                        'total_calories': total_edited_calories,
+                                        'notes': new_notes
+                                    })
                                     
-                                    for i, hist_meal in enumerate(st.session_state.meal_history):
-                                        if (hist_meal['date'] == original_date and 
-                                            hist_meal['timestamp'] == meal['timestamp'] and
-                                            hist_meal['meal_type'] == meal['meal_type']):
-                                            meal_to_edit = i
-                                            break
-                                    
-                                    if meal_to_edit is not None:
-                                        # Remove old calories from daily totals
-                                        st.session_state.daily_totals[original_date] -= st.session_state.meal_history[meal_to_edit]['total_calories']
-                                        if st.session_state.daily_totals[original_date] <= 0:
-                                            del st.session_state.daily_totals[original_date]
-                                        
-                                        # Update the meal
-                                        new_date_str = new_date.isoformat()
-                                        st.session_state.meal_history[meal_to_edit].update({
-                                            'date': new_date_str,
-                                            'meal_type': new_meal_type,
-                                            'foods': [food for food in edited_foods if food['name']],
-                                            'total_calories': total_edited_calories,
-                                            'notes': new_notes
-                                        })
-                                        
-                                        # Add new calories to daily totals
-                                        if new_date_str not in st.session_state.daily_totals:
-                                            st.session_state.daily_totals[new_date_str] = 0
-                                        st.session_state.daily_totals[new_date_str] += total_edited_calories
-                                        
-                                        save_meal_history()
+                                    if updated:
+                                        load_meal_history()
                                         st.success(f"✅ Meal updated! New total: {total_edited_calories} calories")
                                         
                                         # Clear editing state
@@ -1062,14 +1262,10 @@ def main():
                             if 'editing_foods' in st.session_state:
                                 del st.session_state.editing_foods
                             st.rerun()
-            
-            # Daily summary chart
-            if st.session_state.daily_totals:
-                st.subheader("Daily Calorie Trends")
-                df = pd.DataFrame(list(st.session_state.daily_totals.items()), columns=['Date', 'Calories'])
-                df['Date'] = pd.to_datetime(df['Date'])
-                df = df.sort_values('Date')
-                st.line_chart(df.set_index('Date'))
+    
+    with tab3:
+        st.header("Insights")
+        render_insights(daily_goal)
 
 if __name__ == "__main__":
     main()
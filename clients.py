@@ -0,0 +1,83 @@
+"""
+Shared API clients for AI Calorie Tracker
+Process-wide OpenAI and Supabase clients that reuse keep-alive connection pools across sessions
+"""
+
+import inspect
+import os
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from supabase import create_client, Client, ClientOptions
+
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", 10))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", 20))
+SUPABASE_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_MAX_KEEPALIVE", 10))
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 20))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 60))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _pool_limits(max_connections: int, max_keepalive: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """OpenAI client for api_key, created once per process"""
+    registry_key = ("openai", api_key)
+    with _lock:
+        if registry_key not in _clients:
+            _clients[registry_key] = OpenAI(
+                api_key=api_key,
+                timeout=OPENAI_TIMEOUT,
+                max_retries=0,  # Retries happen in openai_gateway, with rate limiting
+                http_client=DefaultHttpxClient(
+                    limits=_pool_limits(OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE),
+                    timeout=OPENAI_TIMEOUT
+                )
+            )
+        return _clients[registry_key]
+
+
+def get_async_openai_client(api_key: str) -> AsyncOpenAI:
+    """AsyncOpenAI client for api_key, created once per process (for the ASGI API service)"""
+    registry_key = ("openai-async", api_key)
+    with _lock:
+        if registry_key not in _clients:
+            _clients[registry_key] = AsyncOpenAI(
+                api_key=api_key,
+                timeout=OPENAI_TIMEOUT,
+                max_retries=0,  # Retries happen in openai_gateway, with rate limiting
+                http_client=DefaultAsyncHttpxClient(
+                    limits=_pool_limits(OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE),
+                    timeout=OPENAI_TIMEOUT
+                )
+            )
+        return _clients[registry_key]
+
+
+def get_supabase_client(url: str, key: str) -> Client:
+    """Supabase client for url/key, created once per process"""
+    registry_key = ("supabase", url, key)
+    with _lock:
+        if registry_key not in _clients:
+            options = {
+                "postgrest_client_timeout": SUPABASE_TIMEOUT,
+                "storage_client_timeout": int(SUPABASE_TIMEOUT)
+            }
+            # Older supabase-py releases manage their own httpx session and take no pool settings
+            if "httpx_client" in inspect.signature(ClientOptions).parameters:
+                options["httpx_client"] = httpx.Client(
+                    limits=_pool_limits(SUPABASE_MAX_CONNECTIONS, SUPABASE_MAX_KEEPALIVE),
+                    timeout=SUPABASE_TIMEOUT
+                )
+            _clients[registry_key] = create_client(url, key, options=ClientOptions(**options))
+        return _clients[registry_key]
@@ -0,0 +1,350 @@
+"""
+Food photo analysis for AI Calorie Tracker
+FoodAnalyzer owns the prompt, model, token budget, response parsing and caching for every entry point
+"""
+
+import asyncio
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from analysis_cache import get_analysis_cache
+from openai_gateway import get_openai_gateway
+from metrics import timer, timed_iter, timed_aiter, record_size, record_usage
+from image_processing import PreparedImage, prepare_image, DEFAULT_MAX_EDGE, DEFAULT_FORMAT, DEFAULT_QUALITY, DEFAULT_TARGET_BYTES
+
+ANALYSIS_MODEL = "gpt-4o"
+MAX_TOKENS = 500
+BATCH_WORKERS = int(os.environ.get("ANALYSIS_BATCH_WORKERS", 4))  # Concurrent requests per photo batch
+
+# The reply format is enforced by RESPONSE_FORMAT, so the prompt only carries instructions
+ANALYSIS_PROMPT = """Analyze this food image and list each distinct food item with its estimated portion and nutrition.
+- Be as accurate as possible with portion sizes (e.g. '1 cup', '150g', '1 medium')
+- calories and total_calories are integers; protein, carbs, fat, fiber and sugar are grams; sodium is mg
+- Use typical food composition when unsure, and lower confidence (0-100) to match
+- notes: one short sentence of observations about the meal"""
+
+
+class FoodItem(BaseModel):
+    """One food item; fields match the foods table"""
+    name: str
+    portion_size: str
+    calories: int = Field(ge=0)
+    protein: float = Field(default=0, ge=0)
+    carbs: float = Field(default=0, ge=0)
+    fat: float = Field(default=0, ge=0)
+    fiber: float = Field(default=0, ge=0)
+    sugar: float = Field(default=0, ge=0)
+    sodium: float = Field(default=0, ge=0)
+    confidence: int = 100
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def clamp_confidence(cls, value):
+        return min(max(round(float(value)), 0), 100)
+
+
+class MealAnalysis(BaseModel):
+    """A complete analysis reply"""
+    foods: list[FoodItem]
+    total_calories: int = Field(ge=0)
+    notes: str = ""
+
+
+_NUMBER = {"type": "number"}
+_FOOD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "portion_size": {"type": "string"},
+        "calories": {"type": "integer"},
+        "protein": _NUMBER, "carbs": _NUMBER, "fat": _NUMBER,
+        "fiber": _NUMBER, "sugar": _NUMBER, "sodium": _NUMBER,
+        "confidence": {"type": "integer"}
+    },
+    "required": ["name", "portion_size", "calories", "protein", "carbs", "fat",
+                 "fiber", "sugar", "sodium", "confidence"],
+    "additionalProperties": False
+}
+
+# Structured outputs: the model can only produce JSON matching this schema
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "meal_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "foods": {"type": "array", "items": _FOOD_SCHEMA},
+                "total_calories": {"type": "integer"},
+                "notes": {"type": "string"}
+            },
+            "required": ["foods", "total_calories", "notes"],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+class AnalysisParseError(ValueError):
+    """The model's reply did not contain a usable JSON analysis"""
+
+    def __init__(self, message: str, response_text: str = ""):
+        super().__init__(message)
+        self.response_text = response_text
+
+
+# Start of the foods array; the schema puts it first in every reply
+FOODS_ARRAY = re.compile(r'"foods"\s*:\s*\[')
+
+
+class FoodStreamParser:
+    """Picks complete food items out of a streamed analysis reply as they arrive
+
+    Tracks JSON string and brace state across chunks, so each item is validated and
+    handed out as soon as its closing brace is seen rather than when the reply ends.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.finish_reason = None
+        self.refusal = None
+        self.usage = None
+        self._pos = 0
+        self._in_foods = False
+        self._foods_done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+
+    def feed_chunk(self, chunk) -> list:
+        """Consume one streamed chat completion chunk; returns food items it completed"""
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return []  # Usage-only chunk
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        refusal = getattr(choice.delta, "refusal", None)
+        if refusal:
+            self.refusal = (self.refusal or "") + refusal
+        return self.feed(choice.delta.content or "")
+
+    def feed(self, text: str) -> list:
+        """Append reply text; returns food items it completed"""
+        self.text += text
+        if not self._in_foods:
+            match = FOODS_ARRAY.search(self.text)
+            if not match:
+                return []
+            self._in_foods = True
+            self._pos = match.end()
+        if self._foods_done:
+            return []
+
+        foods = []
+        for i in range(self._pos, len(self.text)):
+            c = self.text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                if self._depth == 0:
+                    self._item_start = i
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        foods.append(FoodItem.model_validate_json(self.text[self._item_start:i + 1]).model_dump())
+                    except ValidationError:
+                        pass  # Reported when the whole reply is parsed
+            elif c == "]" and self._depth == 0:
+                self._foods_done = True
+                break
+        self._pos = len(self.text)
+        return foods
+
+
+class FoodAnalyzer:
+    """Food photo analysis engine shared by the Streamlit app, its ?api= handlers and the API service
+
+    Callers bring their own OpenAI client (sync or async); everything that shapes the request
+    and the answer lives here, so a prompt or token change is made once.
+    """
+
+    def __init__(self, model: str = ANALYSIS_MODEL, prompt: str = ANALYSIS_PROMPT, max_tokens: int = MAX_TOKENS,
+                 max_edge: int = DEFAULT_MAX_EDGE, fmt: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY,
+                 target_bytes: int = DEFAULT_TARGET_BYTES, cache=None, gateway=None):
+        self.model = model
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.image_options = {"max_edge": max_edge, "fmt": fmt, "quality": quality, "target_bytes": target_bytes}
+        self.cache = cache if cache is not None else get_analysis_cache()
+        self.gateway = gateway if gateway is not None else get_openai_gateway()
+
+    def prepare(self, image: Image.Image) -> PreparedImage:
+        """Orient, downscale and recompress a PIL image for the request"""
+        return prepare_image(image, **self.image_options)
+
+    def prepare_bytes(self, data: bytes) -> PreparedImage:
+        """prepare() for encoded image bytes (JPEG, PNG, HEIC if Pillow can read it)"""
+        return self.prepare(Image.open(io.BytesIO(data)))
+
+    def request(self, prepared: PreparedImage, stream: bool = False) -> dict:
+        """Keyword arguments for chat.completions.create"""
+        if stream:
+            # The final chunk then carries token usage
+            return dict(self.request(prepared), stream=True, stream_options={"include_usage": True})
+        record_size("analysis_image", len(prepared.data))
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": self.prompt},
+                        {"type": "image_url", "image_url": {"url": prepared.data_url(), "detail": prepared.detail}}
+                    ]
+                }
+            ],
+            "max_tokens": self.max_tokens,
+            "response_format": RESPONSE_FORMAT
+        }
+
+    def parse(self, response_text: str, finish_reason: str = None, refusal: str = None) -> dict:
+        """Validate the model's reply against MealAnalysis and return it as a dict"""
+        if refusal:
+            raise AnalysisParseError(f"Model declined to analyze the image: {refusal}")
+        if finish_reason == "length":
+            raise AnalysisParseError("Response was cut off at the token limit", response_text or "")
+        if not response_text:
+            raise AnalysisParseError("Empty response from OpenAI")
+        try:
+            return MealAnalysis.model_validate_json(response_text).model_dump()
+        except ValidationError as e:
+            raise AnalysisParseError(f"Response did not match the analysis schema: {e}", response_text)
+
+    def _parse_response(self, response) -> dict:
+        record_usage(self.model, getattr(response, "usage", None))
+        choice = response.choices[0]
+        return self.parse(choice.message.content, choice.finish_reason, getattr(choice.message, "refusal", None))
+
+    def cache_key(self, prepared: PreparedImage) -> str:
+        """Analysis cache key for a prepared image"""
+        return self.cache.make_key(prepared.data, self.model, self.prompt, prepared.detail)
+
+    def analyze(self, client, image) -> dict:
+        """Analyze a PIL image or PreparedImage with an OpenAI client, answering repeats from the cache"""
+        prepared = image if isinstance(image, PreparedImage) else self.prepare(image)
+        key = self.cache_key(prepared)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Concurrent analyses of the same photo share one request
+        def request():
+            with timer("openai.chat_completion"):
+                return self._parse_response(client.chat.completions.create(**self.request(prepared)))
+
+        analysis = self.gateway.call(client.api_key, request, coalesce_key=key)
+        # Only parsed analyses are cached
+        self.cache.set(key, analysis)
+        return analysis
+
+    async def analyze_async(self, client, prepared: PreparedImage) -> dict:
+        """analyze() for an AsyncOpenAI client; the SQLite cache runs off the event loop"""
+        key = self.cache_key(prepared)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+
+        async def request():
+            with timer("openai.chat_completion"):
+                return self._parse_response(await client.chat.completions.create(**self.request(prepared)))
+
+        analysis = await self.gateway.call_async(client.api_key, request, coalesce_key=key)
+        await asyncio.to_thread(self.cache.set, key, analysis)
+        return analysis
+
+    def analyze_batch(self, client, images: list, max_workers: int = BATCH_WORKERS, progress=None) -> list:
+        """Analyze several photos concurrently on a bounded thread pool
+
+        Returns (analysis, error) pairs in input order; progress(done, total) is called
+        from the calling thread as each photo finishes.
+        """
+        results = [None] * len(images)
+        if not images:
+            return results
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(images)), thread_name_prefix="analyze") as executor:
+            futures = {executor.submit(self.analyze, client, image): i for i, image in enumerate(images)}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    results[futures[future]] = (future.result(), None)
+                except Exception as e:
+                    results[futures[future]] = (None, e)
+                if progress:
+                    progress(done, len(images))
+        return results
+
+    def analyze_stream(self, client, image):
+        """Streaming analyze(): yields {"type": "food", "food": ...} as each item is recognized,
+        then {"type": "analysis", "analysis": ...} with the validated result"""
+        prepared = image if isinstance(image, PreparedImage) else self.prepare(image)
+        key = self.cache_key(prepared)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield from _replay(cached)
+            return
+
+        parser = FoodStreamParser()
+        # The gateway paces and retries opening the stream and holds a concurrency slot until it
+        # is read to the end; a stream can't be shared, so no coalescing. Only time spent waiting
+        # on OpenAI is timed, not time the caller spends handling each food.
+        stream = self.gateway.stream(client.api_key, lambda: client.chat.completions.create(**self.request(prepared, stream=True)))
+        for chunk in timed_iter("openai.chat_completion_stream", stream):
+            for food in parser.feed_chunk(chunk):
+                yield {"type": "food", "food": food}
+        record_usage(self.model, parser.usage)
+        analysis = self.parse(parser.text, parser.finish_reason, parser.refusal)
+        self.cache.set(key, analysis)
+        yield {"type": "analysis", "analysis": analysis}
+
+    async def analyze_stream_async(self, client, prepared: PreparedImage):
+        """analyze_stream() for an AsyncOpenAI client"""
+        key = self.cache_key(prepared)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            for event in _replay(cached):
+                yield event
+            return
+
+        parser = FoodStreamParser()
+        stream = self.gateway.stream_async(
+            client.api_key, lambda: client.chat.completions.create(**self.request(prepared, stream=True))
+        )
+        async for chunk in timed_aiter("openai.chat_completion_stream", stream):
+            for food in parser.feed_chunk(chunk):
+                yield {"type": "food", "food": food}
+        record_usage(self.model, parser.usage)
+        analysis = self.parse(parser.text, parser.finish_reason, parser.refusal)
+        await asyncio.to_thread(self.cache.set, key, analysis)
+        yield {"type": "analysis", "analysis": analysis}
+
+
+def _replay(analysis: dict):
+    """Stream events for an analysis that is already complete (a cache hit)"""
+    for food in analysis.get("foods", []):
+        yield {"type": "food", "food": food}
+    yield {"type": "analysis", "analysis": analysis}
@@ -0,0 +1,130 @@
+"""
+Offline food database for AI Calorie Tracker
+Bundled per-100 g nutrition table (food_nutrition.csv) with a trigram index for type-ahead search
+"""
+
+import csv
+import os
+import re
+import threading
+from collections import defaultdict
+import numpy as np
+from portions import parse_portion
+
+FOOD_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food_nutrition.csv")
+NUTRIENTS = ["calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium"]
+MIN_SCORE = 0.6  # Share of the query's trigrams a name must contain (prefix matches always count)
+
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces"""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def trigrams(key: str) -> set:
+    """Character trigrams of a normalized string, padded so word starts weigh more"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodIndex:
+    """Food names with a trigram index and array-backed per-100 g nutrient columns
+
+    Each trigram maps to a NumPy array of food ids; a search concatenates the query's
+    posting arrays and counts shared trigrams per food with one bincount.
+    """
+
+    def __init__(self, rows: list):
+        self.names = [row["name"] for row in rows]
+        self.servings = [row["serving"] for row in rows]
+        self.serving_grams = np.array([float(row["serving_grams"]) for row in rows], dtype=np.float32)
+        self.nutrients = np.array([[float(row[n] or 0) for n in NUTRIENTS] for row in rows],
+                                  dtype=np.float32).reshape(len(rows), len(NUTRIENTS))
+
+        self._keys = [normalize(name) for name in self.names]
+        postings = defaultdict(list)
+        sizes = []
+        for food_id, key in enumerate(self._keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(food_id)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._sizes = np.array(sizes, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str = FOOD_DATA_PATH) -> "FoodIndex":
+        """Build the index from a CSV with name, serving, serving_grams and NUTRIENTS columns"""
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query: str, limit: int = 8) -> list:
+        """Ids of the best-matching foods: word-prefix matches first, then by trigram overlap"""
+        key = normalize(query)
+        if not key:
+            return []
+        grams = trigrams(key)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return []
+
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names)).astype(np.float32)
+        # How much of the query a name covers, with overall similarity breaking ties toward shorter names
+        coverage = shared / len(grams)
+        score = coverage + 0.1 * shared / (len(grams) + self._sizes - shared)
+        prefix = [food_id for food_id in np.flatnonzero(shared) if f" {key}" in f" {self._keys[food_id]}"]
+        score[prefix] += 1.0
+        candidates = np.union1d(np.flatnonzero(coverage >= MIN_SCORE), np.array(prefix, dtype=np.int64))
+        best = candidates[np.argsort(-score[candidates], kind="stable")[:limit]]
+        return [int(food_id) for food_id in best]
+
+    def portion_grams(self, food_id: int, portion: str):
+        """Grams in a portion of a food, or None if the unit is not understood
+
+        Accepts the food's own serving unit ("3 slices" of a "1 slice" food, "2 cups" of a
+        "1 cup" food), other weights and volumes ("150g", "8 oz", "2 tbsp"; volumes via the
+        portions density table) and plain counts or servings ("2", "1.5 servings").
+        """
+        if not portion or not portion.strip():
+            return float(self.serving_grams[food_id])
+        parsed = parse_portion(portion, self.names[food_id])
+        serving = parse_portion(self.servings[food_id])
+        if parsed.unit == serving.unit and serving.quantity:
+            return parsed.quantity * float(self.serving_grams[food_id]) / serving.quantity
+        if parsed.grams is not None:
+            return parsed.grams
+        if not parsed.unit or parsed.unit == "serving":
+            return parsed.quantity * float(self.serving_grams[food_id])
+        return None
+
+    def food(self, food_id: int, portion: str = None):
+        """Food entry in the analysis format with nutrients scaled to the portion (None if unparseable)"""
+        grams = self.portion_grams(food_id, portion)
+        if grams is None:
+            return None
+        values = self.nutrients[food_id] * (grams / 100.0)
+        food = {
+            "name": self.names[food_id],
+            "portion_size": portion.strip() if portion and portion.strip() else self.servings[food_id]
+        }
+        for name, value in zip(NUTRIENTS, values.tolist()):
+            food[name] = round(value) if name == "calories" else round(value, 1)
+        food["confidence"] = 100
+        food.update(parse_portion(food["portion_size"], self.names[food_id]).fields(), portion_grams=round(grams, 1))
+        return food
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_food_index() -> FoodIndex:
+    """Process-wide food index, loaded on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FoodIndex.load()
+        return _index
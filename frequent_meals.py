@@ -0,0 +1,129 @@
+"""
+Frequent meals for AI Calorie Tracker
+Recency-weighted index of meals that get logged again and again, so they can be re-logged without a photo or AI call
+"""
+
+import heapq
+import math
+from datetime import date
+from food_database import normalize
+
+HALF_LIFE_DAYS = 14  # A meal logged two weeks ago counts half as much as one logged today
+EPOCH = date(2024, 1, 1).toordinal()
+MIN_COUNT = 2  # Times a meal must have been logged before it is suggested
+OTHER_TYPE_WEIGHT = 0.25  # How much logs under other meal types count toward a suggestion
+NO_WEIGHT = float("-inf")  # log2 of a zero weight
+FOOD_KEYS = ["name", "portion_size", "calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium", "confidence"]
+
+
+def meal_signature(meal: dict) -> tuple:
+    """Sorted normalized food names: the same foods make the same meal whatever their order or portions"""
+    return tuple(sorted({normalize(food.get('name') or '') for food in meal.get('foods') or []} - {''}))
+
+
+def _log_weight(meal: dict) -> float:
+    """log2 of the meal's weight, which doubles every HALF_LIFE_DAYS of its date
+
+    Ranking by a sum of these weights matches ranking by a sum of decayed scores (every score
+    decays by the same factor), so nothing has to be recomputed as time passes. Sums are kept
+    as log2 values so they never overflow however far the dates are from EPOCH.
+    """
+    return (date.fromisoformat(meal['date']).toordinal() - EPOCH) / HALF_LIFE_DAYS
+
+
+def log2_sum(values) -> float:
+    """log2(sum(2 ** v for v in values)) without overflow"""
+    values = [v for v in values if v != NO_WEIGHT]
+    if not values:
+        return NO_WEIGHT
+    top = max(values)
+    return top + math.log2(sum(2.0 ** (v - top) for v in values))
+
+
+class FrequentMeal:
+    """Every logged meal with one signature, and its log2 weight per meal type"""
+
+    def __init__(self, signature: tuple):
+        self.signature = signature
+        self.meals = {}
+        self.log_weights = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.meals)
+
+    def latest(self) -> dict:
+        """Most recently logged meal with these foods"""
+        return max(self.meals.values(), key=lambda meal: (meal['date'], meal.get('timestamp') or ''))
+
+    def count_meal(self, meal: dict):
+        meal_type = meal['meal_type']
+        self.log_weights[meal_type] = log2_sum([self.log_weights.get(meal_type, NO_WEIGHT), _log_weight(meal)])
+
+    def recount(self):
+        """Rebuild the weights from the remaining meals (subtracting would leave float residue)"""
+        self.log_weights = {}
+        for meal in self.meals.values():
+            self.count_meal(meal)
+
+    def score(self, meal_type: str) -> float:
+        """log2 of the same-type weight plus OTHER_TYPE_WEIGHT times the other types' weight"""
+        other = math.log2(OTHER_TYPE_WEIGHT)
+        return log2_sum([weight if kind == meal_type else weight + other
+                         for kind, weight in self.log_weights.items()])
+
+
+class FrequentMealsIndex:
+    """Meals grouped by signature, updated one meal at a time as meals are added, changed or removed"""
+
+    def __init__(self):
+        self.entries = {}
+        self._by_id = {}  # meal ID -> signature it was counted under
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, meal: dict):
+        """Count a new meal, or recount one whose foods, type or date changed"""
+        meal_id = meal.get('id') or f"{meal['date']}:{meal.get('timestamp')}"
+        if meal_id in self._by_id:
+            self.remove(meal_id)
+        signature = meal_signature(meal)
+        if not signature:
+            return
+        entry = self.entries.get(signature)
+        if entry is None:
+            entry = self.entries[signature] = FrequentMeal(signature)
+        entry.meals[meal_id] = meal
+        entry.count_meal(meal)
+        self._by_id[meal_id] = signature
+
+    def remove(self, meal_id: str):
+        """Stop counting a deleted meal"""
+        signature = self._by_id.pop(meal_id, None)
+        if signature is None:
+            return
+        entry = self.entries[signature]
+        entry.meals.pop(meal_id, None)
+        if not entry.meals:
+            del self.entries[signature]
+        else:
+            entry.recount()
+
+    def suggestions(self, meal_type: str, limit: int = 3) -> list:
+        """Most logged and most recent meals for meal_type, as meals ready to log again"""
+        candidates = (entry for entry in self.entries.values() if entry.count >= MIN_COUNT)
+        best = heapq.nlargest(limit, candidates, key=lambda entry: entry.score(meal_type))
+        return [relog_meal(entry.latest(), entry.count) for entry in best]
+
+
+def relog_meal(meal: dict, count: int = 1) -> dict:
+    """A copy of a past meal's foods and calories for add_meal_to_history (IDs and photos left behind)"""
+    foods = [{key: food[key] for key in FOOD_KEYS if key in food} for food in meal.get('foods') or []]
+    return {
+        'foods': foods,
+        'total_calories': meal['total_calories'],
+        'notes': '',
+        'meal_type': meal['meal_type'],
+        'count': count
+    }
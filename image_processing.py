@@ -0,0 +1,110 @@
+"""
+Image preprocessing for AI Calorie Tracker
+Normalizes meal photos (orientation, color mode, size, encoding) before AI analysis
+"""
+
+import base64
+import io
+from dataclasses import dataclass
+from PIL import Image, ImageOps
+
+# GPT-4o vision tiling: "low" detail sees one 512px image; "high" detail fits the image
+# into 2048px, scales the shortest side to 768px and bills per 512px tile. A 1024px
+# longest edge keeps a 4:3 phone photo at 1024x768 (2x2 tiles) with nothing thrown away.
+LOW_DETAIL_EDGE = 512
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_FORMAT = "JPEG"
+DEFAULT_QUALITY = 85
+DEFAULT_TARGET_BYTES = 250_000
+MIN_QUALITY = 45
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass
+class PreparedImage:
+    """Encoded image ready for the vision API"""
+    data: bytes
+    mime_type: str
+    detail: str
+    width: int
+    height: int
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode()
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+
+def to_rgb(image: Image.Image) -> Image.Image:
+    """Apply EXIF orientation and flatten to RGB (transparent areas become white)"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def resize_to_max_edge(image: Image.Image, max_edge: int) -> Image.Image:
+    """Downscale so the longest edge is at most max_edge (never upscales)"""
+    if max(image.size) <= max_edge:
+        return image
+    resized = image.copy()
+    resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return resized
+
+
+def encode(image: Image.Image, fmt: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY,
+           target_bytes: int = None) -> bytes:
+    """Encode as JPEG/WebP, stepping quality down until the result fits target_bytes"""
+    while True:
+        buffered = io.BytesIO()
+        image.save(buffered, format=fmt, quality=quality, optimize=True)
+        data = buffered.getvalue()
+        if not target_bytes or len(data) <= target_bytes or quality <= MIN_QUALITY:
+            return data
+        quality = max(quality - 10, MIN_QUALITY)
+
+
+def choose_detail(image: Image.Image) -> str:
+    """Pick the vision detail level: images that fit one low-detail tile don't need "high" """
+    return "low" if max(image.size) <= LOW_DETAIL_EDGE else "high"
+
+
+def prepare_image(image: Image.Image, max_edge: int = DEFAULT_MAX_EDGE, fmt: str = DEFAULT_FORMAT,
+                  quality: int = DEFAULT_QUALITY, target_bytes: int = DEFAULT_TARGET_BYTES) -> PreparedImage:
+    """Orient, flatten, downscale and recompress a photo for analysis"""
+    fmt = fmt.upper()
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+
+    image = resize_to_max_edge(to_rgb(image), max_edge)
+    data = encode(image, fmt, quality, target_bytes)
+    return PreparedImage(
+        data=data,
+        mime_type=MIME_TYPES[fmt],
+        detail=choose_detail(image),
+        width=image.width,
+        height=image.height
+    )
+
+
+# Stored photo variants: longest edge in pixels (None keeps the original size)
+PHOTO_VARIANTS = {"full": None, "medium": 1024, "thumb": 320}
+PHOTO_QUALITY = {"full": 85, "medium": 80, "thumb": 75}
+
+
+def make_photo_variants(image: Image.Image) -> dict:
+    """JPEG bytes for each stored photo variant, keyed by variant name"""
+    image = to_rgb(image)
+    variants = {}
+    for name, max_edge in PHOTO_VARIANTS.items():
+        resized = resize_to_max_edge(image, max_edge) if max_edge else image
+        variants[name] = encode(resized, "JPEG", PHOTO_QUALITY[name])
+    return variants
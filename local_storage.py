@@ -0,0 +1,181 @@
+"""
+Local meal storage for AI Calorie Tracker
+A JSON snapshot plus an append-only journal of changes, compacted with atomic rewrites
+"""
+
+import json
+import os
+import tempfile
+import threading
+import uuid
+from frequent_meals import FrequentMealsIndex
+
+SNAPSHOT_PATH = "meal_history.json"
+JOURNAL_PATH = "meal_history.journal.jsonl"
+COMPACT_AFTER = 200  # Journal records before the snapshot is rewritten
+
+
+def atomic_write_json(path: str, data):
+    """Write JSON to a temp file in the same directory, fsync it, then rename over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class JournalStore:
+    """Meals keyed by ID, persisted as meal_history.json plus a JSONL journal of add/update/delete
+
+    Every change is one appended line, so writes don't grow with history size. Loading
+    replays the journal over the snapshot; replay is idempotent, so a crash between
+    writing a new snapshot and truncating the journal loses nothing.
+    """
+
+    def __init__(self, snapshot_path: str = SNAPSHOT_PATH, journal_path: str = JOURNAL_PATH,
+                 compact_after: int = COMPACT_AFTER):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_after = compact_after
+        self.meals = {}
+        self.version = 0  # Bumped on every change
+        self.frequent_meals = FrequentMealsIndex()  # Kept in step with meals by _apply
+        self._journal_records = 0
+        self._totals = None
+        self._totals_version = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Read the snapshot and replay the journal"""
+        with self._lock:
+            self.meals = {}
+            self.frequent_meals = FrequentMealsIndex()
+            assigned_ids = False
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r") as f:
+                    data = json.load(f)
+                for meal in data.get("meals", []):
+                    if not meal.get("id"):
+                        # Meals from before the journal existed get a stable ID once
+                        meal["id"] = str(uuid.uuid4())
+                        assigned_ids = True
+                    self.meals[meal["id"]] = meal
+                    self.frequent_meals.add(meal)
+
+            self._journal_records = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "rb+") as f:
+                    good_offset = 0
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Torn final write from a crash: keep everything before it
+                            f.truncate(good_offset)
+                            break
+                        self._apply(record)
+                        self._journal_records += 1
+                        good_offset += len(line)
+                        if not line.endswith(b"\n"):
+                            f.write(b"\n")  # Last record lost only its newline
+
+            self.version += 1
+            if assigned_ids:
+                self.compact()
+
+    def _apply(self, record: dict):
+        op = record["op"]
+        if op == "add":
+            self.meals[record["meal"]["id"]] = record["meal"]
+            self.frequent_meals.add(record["meal"])
+        elif op == "update" and record["id"] in self.meals:
+            self.meals[record["id"]].update(record["changes"])
+            self.frequent_meals.add(self.meals[record["id"]])
+        elif op == "delete":
+            self.meals.pop(record["id"], None)
+            self.frequent_meals.remove(record["id"])
+
+    def _append(self, record: dict):
+        with self._lock:
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+            self._journal_records += 1
+            self.version += 1
+            if self._journal_records >= self.compact_after:
+                self.compact()
+
+    def add(self, meal: dict) -> str:
+        """Append a new meal and return its ID"""
+        meal = dict(meal, id=meal.get("id") or str(uuid.uuid4()))
+        self._append({"op": "add", "meal": meal})
+        return meal["id"]
+
+    def update(self, meal_id: str, changes: dict) -> bool:
+        """Apply field changes to a meal"""
+        if meal_id not in self.meals:
+            return False
+        self._append({"op": "update", "id": meal_id, "changes": changes})
+        return True
+
+    def delete(self, meal_id: str) -> bool:
+        """Remove a meal"""
+        if meal_id not in self.meals:
+            return False
+        self._append({"op": "delete", "id": meal_id})
+        return True
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot and start a new journal"""
+        with self._lock:
+            atomic_write_json(self.snapshot_path, {
+                "meals": list(self.meals.values()),
+                "daily_totals": self.daily_totals()
+            })
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_records = 0
+
+    def meal_history(self) -> list:
+        """All meals in insertion order"""
+        with self._lock:
+            return list(self.meals.values())
+
+    def suggestions(self, meal_type: str, limit: int = 3) -> list:
+        """Frequent meals to log again (see FrequentMealsIndex.suggestions)"""
+        with self._lock:
+            return self.frequent_meals.suggestions(meal_type, limit)
+
+    def daily_totals(self) -> dict:
+        """Daily calorie totals computed from the meals (recomputed only after changes)"""
+        with self._lock:
+            if self._totals_version != self.version:
+                totals = {}
+                for meal in self.meals.values():
+                    totals[meal["date"]] = totals.get(meal["date"], 0) + meal["total_calories"]
+                self._totals = totals
+                self._totals_version = self.version
+            return self._totals
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_local_store() -> JournalStore:
+    """Process-wide local store (sessions share one meal_history.json)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JournalStore()
+        return _store
@@ -0,0 +1,204 @@
+"""
+Session-scoped meal cache for AI Calorie Tracker
+Loads recent history a page of days at a time and keeps it current with incremental syncs
+"""
+
+import time
+from datetime import date, datetime, timedelta
+from frequent_meals import FrequentMealsIndex
+
+SYNC_OVERLAP = timedelta(seconds=10)  # Re-read before the watermark for writes committed after their timestamp
+
+
+def _stamp(row: dict):
+    """Version of a meal row, as to_local_meal records it"""
+    return row.get('updated_at') or row.get('created_at')
+
+
+def to_local_meal(meal: dict) -> dict:
+    """Convert a Supabase meal row to the local meal format used by the UI"""
+    return {
+        'id': meal['id'],  # Supabase ID for editing/deleting
+        'date': meal['date'],
+        'timestamp': meal['timestamp'],
+        'meal_type': meal['meal_type'],
+        'total_calories': meal['total_calories'],
+        'notes': meal.get('notes') or '',
+        'photo_url': meal.get('photo_url'),
+        'photo_medium_url': meal.get('photo_medium_url'),
+        'photo_thumb_url': meal.get('photo_thumb_url'),
+        'photo_status': meal.get('photo_status'),
+        'foods': meal.get('foods', []),
+        'updated_at': _stamp(meal)
+    }
+
+
+class MealCache:
+    """Window of the most recent days of meals keyed by ID
+
+    History is paged in by keyset on date (newest first) and refreshed by fetching only
+    rows changed since the last sync. Daily totals cover all history and come from the
+    database aggregate on load, so they don't depend on how many days are loaded; syncs
+    and deletions then apply each meal's change to them.
+    """
+
+    def __init__(self, manager, max_age: float = 30.0, page_rows: int = 100):
+        self.manager = manager
+        self.max_age = max_age  # Seconds between automatic incremental syncs
+        self.page_rows = page_rows  # Meals fetched per history page
+        self.meals = {}
+        self.daily_totals = {}
+        self.watermark = None  # Highest updated_at seen from the server
+        self.oldest_date = None  # Oldest fully loaded date
+        self.has_more = False
+        self.loaded = False
+        self.last_sync = 0.0
+        self.version = 0  # Bumped whenever cached meals or totals change
+        self.data_version = 0  # Bumped only when stored meals change (not when older pages load)
+        self.frequent_meals = FrequentMealsIndex()  # Kept in step with meals by _merge and remove
+        self.outside = {}  # (date, total_calories) of synced meals dated before the window
+        self.stamps = {}  # meal ID -> updated_at of the copy last merged
+
+    def sync(self, force: bool = False):
+        """Load on first use, then refresh incrementally once the cache is stale"""
+        if not self.loaded:
+            return self.load()
+        if force or time.monotonic() - self.last_sync >= self.max_age:
+            return self.refresh()
+        return True
+
+    def load(self):
+        """Load the first page of history and the daily totals"""
+        self.meals = {}
+        self.frequent_meals = FrequentMealsIndex()
+        self.outside = {}
+        self.stamps = {}
+        self.watermark = None
+        self.oldest_date = None
+        self.has_more = True
+        self.load_more()
+        self.daily_totals = self.manager.get_daily_totals()
+        self.version += 1
+        self.data_version += 1
+        self.loaded = True
+        self.last_sync = time.monotonic()
+        return True
+
+    def load_more(self):
+        """Fetch the next page of older days (whole days only)"""
+        if not self.has_more:
+            return False
+        rows = self.manager.get_meals(before_date=self.oldest_date, limit=self.page_rows)
+        self.has_more = len(rows) == self.page_rows
+        if self.has_more:
+            # The last day may be cut off by the limit: fetch it completely
+            last_date = rows[-1]['date']
+            last_day = date.fromisoformat(last_date)
+            rows = [row for row in rows if row['date'] != last_date]
+            rows += self.manager.get_meals(start_date=last_day, end_date=last_day)
+        if rows:
+            self.oldest_date = rows[-1]['date']
+        self._merge(rows)
+        self.version += 1
+        return True
+
+    def refresh(self):
+        """Fetch meals created or updated since the watermark and merge them in"""
+        if not self.loaded:
+            return self.load()
+        # With no watermark yet the cache is empty, so this fetches whatever exists now
+        since = self._sync_since()
+        rows = self.manager.get_meals(updated_since=since)
+        # The overlap re-reads rows already merged: keep only versions not seen before
+        changed = [row for row in rows if self.stamps.get(row['id']) != _stamp(row)]
+        if changed:
+            if not self._apply_totals(changed, since):
+                return self.load()
+            self._merge(changed)
+            self.version += 1
+            self.data_version += 1
+        self.last_sync = time.monotonic()
+        return True
+
+    def remove(self, meal_id: str):
+        """Drop a deleted meal (deletions are not visible to incremental syncs)"""
+        meal = self.meals.pop(meal_id, None)
+        self.frequent_meals.remove(meal_id)
+        self.stamps.pop(meal_id, None)
+        if meal is None and meal_id in self.outside:
+            meal_date, calories = self.outside.pop(meal_id)
+            meal = {'date': meal_date, 'total_calories': calories}
+        if meal is not None:
+            self._add_total(meal['date'], -meal['total_calories'])
+            self.version += 1
+            self.data_version += 1
+
+    def invalidate(self):
+        """Force a full reload on the next sync"""
+        self.loaded = False
+
+    def loaded_days(self) -> int:
+        """Number of distinct dates in the window"""
+        return len({meal['date'] for meal in self.meals.values()})
+
+    def meals_for_date(self, date_str: str) -> list:
+        """Meals on one date, from the window if loaded, otherwise straight from the database"""
+        if not self.has_more or (self.oldest_date and date_str >= self.oldest_date):
+            return [meal for meal in self.meals.values() if meal['date'] == date_str]
+        day = date.fromisoformat(date_str)
+        return [to_local_meal(row) for row in self.manager.get_meals(start_date=day, end_date=day)]
+
+    def _add_total(self, date_str: str, calories):
+        """Add calories (negative to subtract) to one day's total, dropping days that reach zero"""
+        remaining = self.daily_totals.get(date_str, 0) + calories
+        if remaining > 0:
+            self.daily_totals[date_str] = remaining
+        else:
+            self.daily_totals.pop(date_str, None)
+
+    def _sync_since(self):
+        """Watermark less SYNC_OVERLAP, since a transaction can commit after a later sync has run"""
+        if not self.watermark:
+            return None
+        try:
+            return (datetime.fromisoformat(self.watermark) - SYNC_OVERLAP).isoformat()
+        except ValueError:
+            return self.watermark
+
+    def _apply_totals(self, rows: list, since: str = None) -> bool:
+        """Move changed meals' calories from their old day to their new one
+
+        Returns False when a row updates a meal the cache never saw (dated before the
+        window), whose old calories are unknown, so the totals need a full load instead.
+        """
+        for row in rows:
+            previous = self.meals.get(row['id'])
+            if previous is not None:
+                self._add_total(previous['date'], -previous['total_calories'])
+            elif row['id'] in self.outside:
+                old_date, old_calories = self.outside[row['id']]
+                self._add_total(old_date, -old_calories)
+            elif since and (row.get('created_at') or '') < since:
+                return False
+            self._add_total(row['date'], row['total_calories'])
+        return True
+
+    def _merge(self, rows: list):
+        for row in rows:
+            meal = to_local_meal(row)
+            self.stamps[meal['id']] = meal['updated_at']
+            if meal['updated_at'] and (self.watermark is None or meal['updated_at'] > self.watermark):
+                self.watermark = meal['updated_at']
+            # Rows dated before the loaded window are left for paging
+            if self.has_more and self.oldest_date and meal['date'] < self.oldest_date:
+                self.meals.pop(meal['id'], None)
+                self.frequent_meals.remove(meal['id'])
+                self.outside[meal['id']] = (meal['date'], meal['total_calories'])
+                continue
+            self.outside.pop(meal['id'], None)
+            self.meals[meal['id']] = meal
+            self.frequent_meals.add(meal)
+
+    def meal_history(self) -> list:
+        """Cached meals, most recent first"""
+        return sorted(self.meals.values(), key=lambda m: (m['date'], m['timestamp']), reverse=True)
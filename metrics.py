@@ -0,0 +1,216 @@
+"""
+Metrics for AI Calorie Tracker
+In-process latency and payload-size histograms, error counts and OpenAI token usage, with a Prometheus text export
+"""
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))  # 1 KB .. 16 MB
+PREFIX = "calorie_tracker"
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        target = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                return bound
+        return float("inf")
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": self.quantile(0.5) if self.count else 0.0,
+            "p95": self.quantile(0.95) if self.count else 0.0
+        }
+
+
+class Metrics:
+    """Thread-safe registry of labelled histograms and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> float
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """Summaries for the health endpoints, keyed by metric name and label values"""
+        result = {}
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                result.setdefault(name, {})["/".join(v for _, v in labels) or "all"] = histogram.summary()
+            for (name, labels), value in self._counters.items():
+                result.setdefault(name, {})["/".join(v for _, v in labels) or "all"] = value
+        return result
+
+    def prometheus(self, gauges: dict = None) -> str:
+        """Prometheus text exposition of everything recorded, plus optional extra gauges"""
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                for (n, labels), h in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f"{PREFIX}_{name}_bucket{_labels(labels, le=bound)} {count}")
+                    lines.append(f"{PREFIX}_{name}_bucket{_labels(labels, le='+Inf')} {h.count}")
+                    lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {h.count}")
+            for name in sorted({n for n, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + [(k, v) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics registry"""
+    return _metrics
+
+
+@contextmanager
+def timer(operation: str):
+    """Record the block's latency under operation, and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _metrics.inc("operation_errors_total", operation=operation)
+        raise
+    finally:
+        _metrics.observe("operation_seconds", time.perf_counter() - start, operation=operation)
+
+
+def timed(operation: str, failed=None):
+    """Decorator form of timer() for functions and coroutine functions
+
+    failed(result) marks a returned value as an error, for functions that report
+    failures with st.error and a None/False return instead of raising.
+    """
+    def decorator(fn):
+        def check(result):
+            if failed is not None and failed(result):
+                _metrics.inc("operation_errors_total", operation=operation)
+            return result
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(operation):
+                    return check(await fn(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(operation):
+                return check(fn(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def timed_iter(operation: str, iterable):
+    """Yield from iterable, recording only the time spent waiting on it (not on the consumer)"""
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                _metrics.inc("operation_errors_total", operation=operation)
+                raise
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        _metrics.observe("operation_seconds", elapsed, operation=operation)
+        if hasattr(iterator, "close"):
+            iterator.close()  # Let the source release what it holds if we stopped early
+
+
+async def timed_aiter(operation: str, iterable):
+    """timed_iter() for async iterables"""
+    iterator = iterable.__aiter__()
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception:
+                _metrics.inc("operation_errors_total", operation=operation)
+                raise
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        _metrics.observe("operation_seconds", elapsed, operation=operation)
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def record_size(kind: str, num_bytes: int):
+    """Record a payload size (image sent for analysis, photo uploaded, ...)"""
+    _metrics.observe("payload_bytes", num_bytes, buckets=SIZE_BUCKETS, kind=kind)
+
+
+def record_usage(model: str, usage):
+    """Add an OpenAI response's token usage to the running totals"""
+    if usage is None:
+        return
+    _metrics.inc("openai_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, model=model, type="prompt")
+    _metrics.inc("openai_tokens_total", getattr(usage, "completion_tokens", 0) or 0, model=model, type="completion")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Copy local meal history (meal_history.json plus its journal) into Supabase
+
+Reads Supabase credentials from .streamlit/secrets.toml, like the app. Safe to re-run:
+meals already in Supabase are skipped and an interrupted run resumes from its checkpoint.
+
+    python migrate_to_supabase.py [--batch-size N] [--workers N]
+"""
+
+import argparse
+from local_storage import JournalStore, SNAPSHOT_PATH, JOURNAL_PATH
+from supabase_client import SupabaseManager, MIGRATION_BATCH_SIZE, MIGRATION_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate local JSON meal history to Supabase")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="meal history JSON file")
+    parser.add_argument("--journal", default=JOURNAL_PATH, help="journal of changes since the snapshot")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="meals per request")
+    parser.add_argument("--workers", type=int, default=MIGRATION_WORKERS, help="concurrent requests")
+    args = parser.parse_args()
+
+    manager = SupabaseManager()
+    if not manager.is_connected():
+        raise SystemExit("Could not connect to Supabase; check .streamlit/secrets.toml")
+
+    meals = JournalStore(args.snapshot, args.journal).meal_history()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} meals processed", end="", flush=True)
+
+    migrated = manager.migrate_from_json({"meals": meals}, batch_size=args.batch_size,
+                                         workers=args.workers, progress=progress)
+    print(f"\nMigrated {migrated} new meals")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+OpenAI gateway for AI Calorie Tracker
+Per-key rate limiting, a concurrency cap, jittered retries and coalescing of duplicate in-flight requests
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+import openai
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_PER_MINUTE = float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 60))
+BURST = int(os.environ.get("OPENAI_BURST", 10))
+MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8))
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 4))
+BACKOFF_BASE = float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5))  # Seconds; doubled per attempt
+BACKOFF_MAX = float(os.environ.get("OPENAI_BACKOFF_MAX", 20))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, dropped connections and 5xx responses are worth retrying"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def retry_after(error: Exception):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Request-rate limiter; callers reserve a token and are told how long to wait for it"""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token (possibly borrowing from the future); returns seconds until it is valid"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class OpenAIGateway:
+    """Shared path for every OpenAI request in the process
+
+    Each API key gets a token bucket, and a semaphore caps requests in flight. Retryable
+    failures back off exponentially with full jitter (honoring Retry-After). Calls made with
+    the same coalescing key while one is already running wait for that result instead of
+    making their own request.
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE, burst: int = BURST,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets = {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = weakref.WeakKeyDictionary()  # Event loop -> asyncio.Semaphore
+        self._inflight = {}
+        self._async_inflight = weakref.WeakKeyDictionary()  # Event loop -> {coalesce_key: asyncio.Future}
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "errors": 0, "coalesced": 0, "queue_depth": 0, "in_flight": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _bucket(self, api_key: str) -> TokenBucket:
+        with self._lock:
+            if api_key not in self._buckets:
+                self._buckets[api_key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[api_key]
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def _record_wait(self, seconds: float):
+        with self._lock:
+            self._wait_total += seconds
+            self._wait_max = max(self._wait_max, seconds)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(error) or 0)
+
+    def call(self, api_key: str, fn, coalesce_key: str = None):
+        """Run fn() under the rate limit and concurrency cap, retrying transient errors"""
+        if coalesce_key is None:
+            return self._call(api_key, fn)
+
+        with self._lock:
+            future = self._inflight.get(coalesce_key)
+            owner = future is None
+            if owner:
+                future = self._inflight[coalesce_key] = Future()
+            else:
+                self._counters["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._call(api_key, fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(coalesce_key, None)
+
+    def stream(self, api_key: str, fn):
+        """Open a stream with fn() like call() and yield its chunks
+
+        The concurrency slot is held until the stream is exhausted or this generator is
+        closed, so streams being read count toward max_concurrency.
+        """
+        stream = self._call(api_key, fn, keep_slot=True)
+        try:
+            yield from stream
+        finally:
+            try:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+            finally:
+                self._count("in_flight", -1)
+                self._slots.release()
+
+    def _call(self, api_key: str, fn, keep_slot: bool = False):
+        """fn() with pacing and retries; with keep_slot, a successful call leaves its slot for the caller to release"""
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            self._count("queue_depth")
+            try:
+                delay = self._bucket(api_key).reserve()
+                if delay:
+                    time.sleep(delay)
+                self._slots.acquire()
+            finally:
+                self._count("queue_depth", -1)
+            self._record_wait(time.monotonic() - queued)
+
+            self._count("in_flight")
+            self._count("requests")
+            kept = False
+            try:
+                result = fn()
+                kept = keep_slot
+                return result
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count("errors")
+                    raise
+                error = e
+            finally:
+                if not kept:
+                    self._count("in_flight", -1)
+                    self._slots.release()
+
+            self._count("retries")
+            delay = self._backoff(attempt, error)
+            logger.warning("OpenAI request failed (%s); retry %d/%d in %.1fs",
+                           error, attempt + 1, self.max_retries, delay)
+            time.sleep(delay)
+
+    async def call_async(self, api_key: str, fn, coalesce_key: str = None):
+        """call() for coroutine functions, run on the current event loop"""
+        if coalesce_key is None:
+            return await self._call_async(api_key, fn)
+
+        loop = asyncio.get_running_loop()
+        inflight = self._async_inflight.setdefault(loop, {})
+        future = inflight.get(coalesce_key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = inflight[coalesce_key] = loop.create_future()
+        try:
+            result = await self._call_async(api_key, fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else was waiting
+            raise
+        finally:
+            inflight.pop(coalesce_key, None)
+
+    async def stream_async(self, api_key: str, fn):
+        """stream() for coroutine functions returning an async stream"""
+        slots = self._loop_slots()
+        stream = await self._call_async(api_key, fn, keep_slot=True)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            try:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+            finally:
+                self._count("in_flight", -1)
+                slots.release()
+
+    def _loop_slots(self) -> asyncio.Semaphore:
+        """Concurrency semaphore for the running event loop"""
+        return self._async_slots.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self.max_concurrency))
+
+    async def _call_async(self, api_key: str, fn, keep_slot: bool = False):
+        slots = self._loop_slots()
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            self._count("queue_depth")
+            try:
+                delay = self._bucket(api_key).reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                await slots.acquire()
+            finally:
+                self._count("queue_depth", -1)
+            self._record_wait(time.monotonic() - queued)
+
+            self._count("in_flight")
+            self._count("requests")
+            kept = False
+            try:
+                result = await fn()
+                kept = keep_slot
+                return result
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count("errors")
+                    raise
+                error = e
+            finally:
+                if not kept:
+                    self._count("in_flight", -1)
+                    slots.release()
+
+            self._count("retries")
+            delay = self._backoff(attempt, error)
+            logger.warning("OpenAI request failed (%s); retry %d/%d in %.1fs",
+                           error, attempt + 1, self.max_retries, delay)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight requests, retry/coalescing counters and wait times"""
+        with self._lock:
+            requests = self._counters["requests"]
+            return dict(
+                self._counters,
+                avg_wait_seconds=round(self._wait_total / requests, 3) if requests else 0.0,
+                max_wait_seconds=round(self._wait_max, 3)
+            )
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_openai_gateway() -> OpenAIGateway:
+    """Process-wide OpenAI gateway"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = OpenAIGateway()
+        return _gateway
@@ -0,0 +1,86 @@
+"""
+Background photo uploads for AI Calorie Tracker
+Uploads meal photos off the save path and patches photo_url on the meal when done
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.environ.get("PHOTO_UPLOAD_WORKERS", 2))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("PHOTO_UPLOAD_QUEUE_SIZE", 32))
+UPLOAD_RETRIES = int(os.environ.get("PHOTO_UPLOAD_RETRIES", 3))
+UPLOAD_BACKOFF = 1.0  # Seconds before the first retry, doubled after each attempt
+
+
+class PhotoUploadQueue:
+    """Bounded queue of photo uploads run on a small thread pool with retries"""
+
+    def __init__(self, workers: int = UPLOAD_WORKERS, max_pending: int = UPLOAD_QUEUE_SIZE,
+                 retries: int = UPLOAD_RETRIES, backoff: float = UPLOAD_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self.completed = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-upload")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, manager, image, meal_id: str) -> bool:
+        """Queue an upload for a saved meal; returns False if the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._pending += 1
+        # Copy so the upload doesn't depend on the session keeping the image alive
+        self._executor.submit(self._run, manager, image.copy(), meal_id)
+        return True
+
+    def _run(self, manager, image, meal_id: str):
+        try:
+            for attempt in range(1, self.retries + 1):
+                try:
+                    photo_urls = manager.store_photo(image, meal_id)
+                    manager.set_photo_urls(meal_id, photo_urls)
+                    with self._lock:
+                        self.completed += 1
+                    return
+                except Exception as e:
+                    logger.warning("Photo upload for meal %s failed (attempt %d/%d): %s",
+                                   meal_id, attempt, self.retries, e)
+                    if attempt < self.retries:
+                        time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            with self._lock:
+                self.failed += 1
+            try:
+                manager.mark_photo_failed(meal_id)
+            except Exception as e:
+                logger.warning("Could not mark photo upload failed for meal %s: %s", meal_id, e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Queue depth and outcome counters"""
+        with self._lock:
+            return {"pending": self._pending, "completed": self.completed, "failed": self.failed}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_photo_upload_queue() -> PhotoUploadQueue:
+    """Process-wide photo upload queue"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = PhotoUploadQueue()
+        return _queue
@@ -0,0 +1,219 @@
+"""
+Portion sizes for AI Calorie Tracker
+Parses free-text portions ("1 cup", "150g", "1 medium (118g)") into a quantity, unit and gram weight so nutrients can be rescaled
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Grams per mass unit and millilitres per volume unit (US customary volumes)
+MASS_GRAMS = {"g": 1, "mg": 0.001, "kg": 1000, "oz": 28.35, "lb": 453.6}
+VOLUME_ML = {"ml": 1, "cl": 10, "dl": 100, "l": 1000, "tsp": 4.93, "tbsp": 14.79,
+             "fl oz": 29.57, "cup": 240, "pint": 473, "quart": 946, "gallon": 3785}
+UNIT_ALIASES = {
+    "gram": "g", "gr": "g", "grm": "g", "milligram": "mg", "kilogram": "kg", "kilo": "kg",
+    "ounce": "oz", "pound": "lb", "lbs": "lb",
+    "milliliter": "ml", "millilitre": "ml", "mls": "ml", "centiliter": "cl", "deciliter": "dl",
+    "liter": "l", "litre": "l", "ltr": "l",
+    "teaspoon": "tsp", "tsps": "tsp", "tablespoon": "tbsp", "tbs": "tbsp", "tbl": "tbsp", "tbsps": "tbsp",
+    "fluid ounce": "fl oz", "fl ounce": "fl oz", "c": "cup", "pt": "pint", "qt": "quart", "gal": "gallon",
+    "servings": "serving", "portion": "serving"
+}
+
+# Grams per millilitre, matched against the start of a word in the food name in order (so "peanut
+# butter" wins over "butter" and "steak" is not "tea"); anything unlisted is taken at the density of water
+DENSITY = [
+    ("peanut butter", 1.08), ("almond butter", 1.08), ("olive oil", 0.92), ("oil", 0.92),
+    ("butter", 0.91), ("honey", 1.42), ("syrup", 1.33), ("jam", 1.33), ("sugar", 0.85),
+    ("flour", 0.53), ("oats", 0.34), ("oatmeal", 0.98), ("granola", 0.45), ("cereal", 0.15),
+    ("rice", 0.79), ("quinoa", 0.78), ("pasta", 0.59), ("spaghetti", 0.59), ("noodle", 0.59),
+    ("beans", 0.75), ("lentils", 0.83), ("chickpeas", 0.69), ("corn", 0.69), ("peas", 0.61),
+    ("almonds", 0.6), ("nuts", 0.6), ("walnuts", 0.42), ("raisins", 0.61), ("seeds", 0.6),
+    ("shredded cheese", 0.47), ("cottage cheese", 0.95), ("cheese", 0.47), ("yogurt", 1.06),
+    ("ice cream", 0.55), ("cream", 1.0), ("milk", 1.03),
+    ("berries", 0.62), ("blueberries", 0.62), ("strawberries", 0.63), ("grapes", 0.64),
+    ("spinach", 0.13), ("lettuce", 0.2), ("salad", 0.2), ("kale", 0.28), ("broccoli", 0.38),
+    ("chopped", 0.6), ("diced", 0.6), ("mashed potato", 0.88), ("potato", 0.63),
+    ("soup", 1.0), ("juice", 1.04), ("coffee", 1.0), ("tea", 1.0), ("water", 1.0)
+]
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                "half": 0.5, "quarter": 0.25, "third": 1 / 3, "dozen": 12}
+UNICODE_FRACTIONS = {"½": " 1/2", "¼": " 1/4", "¾": " 3/4", "⅓": " 1/3", "⅔": " 2/3", "⅛": " 1/8"}
+
+_NUMBER = r"\d+(?:\.\d+)?(?:\s+\d+/\d+|/\d+)?"
+QUANTITY = re.compile(rf"^\s*(?:({_NUMBER})(?:\s*(?:-|to)\s*({_NUMBER}))?|([a-z]+)\b(?:\s+of\b)?)\s*")
+# Hedges in front of an amount ("about 100g", "~150 g", "approx. 1 cup"), dropped before parsing
+QUALIFIER = re.compile(r"^\s*(?:(?:about|approx(?:imately|\.)?|around|roughly|nearly|almost|circa|ca\.|"
+                       r"estimated|est\.|~|≈)\s*)+")
+# "x2", "2x" and "2 x 100g": a count of whatever portion follows (or of the original one)
+MULTIPLIER = re.compile(r"^\s*(?:[x×]\s*(\d+(?:\.\d+)?)\b|(\d+(?:\.\d+)?)\s*[x×](?![a-z\d]))")
+METRIC = re.compile(r"(\d+(?:\.\d+)?)\s*(g|grams?|kg|oz|ml|l)\b")
+PARENTHESES = re.compile(r"\(([^)]*)\)")
+
+# Columns the normalized portion is stored in (foods table)
+PORTION_FIELDS = ["portion_quantity", "portion_unit", "portion_grams"]
+
+
+@dataclass
+class Portion:
+    """A parsed portion: quantity of unit, and its weight when it could be worked out"""
+    quantity: float
+    unit: str
+    grams: Optional[float] = None
+
+    def fields(self) -> dict:
+        """Values for the foods table's portion_quantity, portion_unit and portion_grams columns"""
+        return {
+            "portion_quantity": round(self.quantity, 3),
+            "portion_unit": self.unit,
+            "portion_grams": round(self.grams, 1) if self.grams is not None else None
+        }
+
+
+def singular(word: str) -> str:
+    """Naive English singular ("slices" -> "slice", "cherries" -> "cherry", "glasses" -> "glass")"""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    return word[:-1] if word.endswith("s") and not word.endswith("ss") and len(word) > 2 else word
+
+
+def canonical_unit(word: str) -> str:
+    """Unit word mapped onto MASS_GRAMS/VOLUME_ML keys where it is one, otherwise its singular"""
+    word = word.strip(" .")
+    if word in UNIT_ALIASES:
+        return UNIT_ALIASES[word]
+    if word in MASS_GRAMS or word in VOLUME_ML:
+        return word
+    word = singular(word)
+    return UNIT_ALIASES.get(word, word)
+
+
+def density(name: str) -> float:
+    """Grams per millilitre for a food name"""
+    name = (name or "").lower()
+    for keyword, grams_per_ml in DENSITY:
+        if re.search(rf"\b{keyword}", name):
+            return grams_per_ml
+    return 1.0
+
+
+def _number(text: str) -> float:
+    """Decimal, fraction ("1/2") or mixed number ("1 1/2")"""
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            total += float(numerator) / float(denominator) if float(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+
+def to_grams(quantity: float, unit: str, name: str = "") -> Optional[float]:
+    """Weight of quantity units of a food, or None for counts ("slice", "medium") that need food data"""
+    if unit in MASS_GRAMS:
+        return quantity * MASS_GRAMS[unit]
+    if unit in VOLUME_ML:
+        return quantity * VOLUME_ML[unit] * density(name)
+    return None
+
+
+def parse_portion(text: str, name: str = "") -> Portion:
+    """Portion from free text; name picks the density for volumes
+
+    Handles decimals, fractions and mixed numbers ("1 1/2 cups", "½ cup"), ranges (averaged),
+    number words ("a slice", "half a cup"), no quantity (1), leading hedges ("about 100g"),
+    multipliers ("x2", "2x") and an explicit weight in parentheses, which wins over a count or volume ("1 medium (118g)").
+    """
+    text = QUALIFIER.sub("", (text or "").lower())
+    multiplier = MULTIPLIER.match(text)
+    if multiplier:
+        times = float(multiplier.group(1) or multiplier.group(2))
+        portion = parse_portion(text[multiplier.end():], name)
+        return Portion(portion.quantity * times, portion.unit,
+                       portion.grams * times if portion.grams is not None else None)
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        text = text.replace(symbol, fraction)
+    text = text.replace(",", ".") if re.search(r"\d,\d", text) else text
+
+    quantity, rest = 1.0, text
+    match = QUANTITY.match(text)
+    if match and match.group(1):
+        quantity = _number(match.group(1))
+        if match.group(2):
+            quantity = (quantity + _number(match.group(2))) / 2
+        rest = text[match.end():]
+    elif match and match.group(3) in NUMBER_WORDS:
+        quantity = NUMBER_WORDS[match.group(3)]
+        rest = text[match.end():]
+        # "half a cup", "a dozen eggs"
+        second = QUANTITY.match(rest)
+        if second and second.group(3) in NUMBER_WORDS:
+            quantity *= NUMBER_WORDS[second.group(3)]
+            rest = rest[second.end():]
+
+    words = re.findall(r"[a-z]+\.?", PARENTHESES.sub(" ", rest))
+    if len(words) >= 2 and canonical_unit(" ".join(words[:2])) in VOLUME_ML:
+        unit = canonical_unit(" ".join(words[:2]))
+    else:
+        unit = canonical_unit(words[0]) if words else ""
+
+    grams = to_grams(quantity, unit, name)
+    for inner in PARENTHESES.findall(rest):
+        metric = METRIC.search(inner)
+        if metric:
+            grams = to_grams(float(metric.group(1)), canonical_unit(metric.group(2)), name)
+            break
+    return Portion(quantity, unit, grams)
+
+
+def portion_fields(portion_size: str, name: str = "") -> dict:
+    """Normalized portion columns for a food row"""
+    return parse_portion(portion_size, name).fields()
+
+
+def scale_factor(old: Portion, new: Portion) -> Optional[float]:
+    """How many times bigger new is than old, or None when they can't be compared
+
+    Weights are compared when both are known; otherwise the quantities must share a
+    unit ("1 slice" -> "3 slices"), with a bare number counting as the other's unit.
+    """
+    if old.grams and new.grams is not None:
+        return new.grams / old.grams
+    countable = old.unit not in MASS_GRAMS and old.unit not in VOLUME_ML
+    if old.quantity and (new.unit == old.unit or (countable and not new.unit) or (not old.unit and new.grams is None)):
+        return new.quantity / old.quantity
+    return None
+
+
+def scale_nutrients(food: dict, factor: float) -> dict:
+    """Copy of food with calories and macros multiplied by factor"""
+    scaled = dict(food, calories=round(float(food.get("calories") or 0) * factor))
+    for nutrient in ("protein", "carbs", "fat", "fiber", "sugar", "sodium"):
+        if nutrient in food:
+            scaled[nutrient] = round(float(food[nutrient] or 0) * factor, 1)
+    return scaled
+
+
+def rescale(food: dict, portion_size: str) -> Optional[dict]:
+    """Copy of food with calories and macros scaled to a new portion, or None if it can't be scaled"""
+    name = food.get("name", "")
+    old, new = parse_portion(food.get("portion_size", ""), name), parse_portion(portion_size, name)
+    factor = scale_factor(old, new)
+    if factor is None:
+        return None
+    if new.grams is None and old.grams:
+        new.grams = old.grams * factor  # "1 medium (118g)" -> "2 medium" is 236 g
+    return scale_nutrients(dict(food, portion_size=portion_size, **new.fields()), factor)
+
+
+def follow_portion(original: dict, edited: dict) -> dict:
+    """edited, rescaled from original when its portion changed but its calories were left alone"""
+    if edited.get("portion_size") == original.get("portion_size") or edited.get("calories") != original.get("calories"):
+        return edited
+    scaled = rescale(dict(edited, portion_size=original.get("portion_size", "")), edited.get("portion_size", ""))
+    return scaled or edited
@@ -0,0 +1,422 @@
+"""
+SQLite store for AI Calorie Tracker
+Offline drop-in for SupabaseManager with meals/foods tables and indexes mirroring supabase_schema.sql
+"""
+
+import streamlit as st
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, date, timezone
+from metrics import timed
+from portions import PORTION_FIELDS, portion_fields
+
+DEFAULT_DB_PATH = "meal_history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'default_user',
+    date TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    meal_type TEXT NOT NULL CHECK (meal_type IN ('Breakfast', 'Lunch', 'Dinner', 'Snack')),
+    total_calories INTEGER NOT NULL DEFAULT 0,
+    notes TEXT,
+    photo_url TEXT,
+    photo_medium_url TEXT,
+    photo_thumb_url TEXT,
+    photo_status TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS foods (
+    id TEXT PRIMARY KEY,
+    meal_id TEXT NOT NULL REFERENCES meals(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    portion_size TEXT NOT NULL,
+    calories INTEGER NOT NULL DEFAULT 0,
+    protein REAL DEFAULT 0,
+    carbs REAL DEFAULT 0,
+    fat REAL DEFAULT 0,
+    fiber REAL DEFAULT 0,
+    sugar REAL DEFAULT 0,
+    sodium REAL DEFAULT 0,
+    confidence INTEGER DEFAULT 100 CHECK (confidence >= 0 AND confidence <= 100),
+    portion_quantity REAL,
+    portion_unit TEXT,
+    portion_grams REAL,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals(user_id, date DESC);
+CREATE INDEX IF NOT EXISTS idx_meals_timestamp ON meals(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_meals_updated_at ON meals(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_foods_meal_id ON foods(meal_id);
+"""
+
+FOOD_COLUMNS = ["id", "name", "portion_size", "calories", "protein", "carbs", "fat",
+                "fiber", "sugar", "sodium", "confidence"] + PORTION_FIELDS
+UPDATE_COLUMNS = FOOD_COLUMNS[1:]
+UPDATE_DEFAULTS = [None, None, 0, 0, 0, 0, 0, 0, 0, 100, None, None, None]
+INSERT_FOOD_SQL = (f"INSERT INTO foods (meal_id, created_at, {', '.join(FOOD_COLUMNS)}) "
+                   f"VALUES ({', '.join('?' * (len(FOOD_COLUMNS) + 2))})")
+
+# Per-day rollup kept current by triggers, mirroring public.daily_nutrition in supabase_schema.sql.
+# Meal deletes subtract their foods before the cascade runs; the cascaded food deletes then
+# find no meal and change nothing.
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_nutrition (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    meal_count INTEGER NOT NULL DEFAULT 0,
+    total_calories INTEGER NOT NULL DEFAULT 0,
+    protein REAL NOT NULL DEFAULT 0,
+    carbs REAL NOT NULL DEFAULT 0,
+    fat REAL NOT NULL DEFAULT 0,
+    fiber REAL NOT NULL DEFAULT 0,
+    sugar REAL NOT NULL DEFAULT 0,
+    sodium REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date)
+);
+
+CREATE TRIGGER IF NOT EXISTS meals_rollup_insert AFTER INSERT ON meals BEGIN
+    INSERT INTO daily_nutrition (user_id, date, meal_count, total_calories)
+    VALUES (NEW.user_id, NEW.date, 1, NEW.total_calories)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        meal_count = meal_count + 1, total_calories = total_calories + excluded.total_calories;
+END;
+
+CREATE TRIGGER IF NOT EXISTS meals_rollup_delete BEFORE DELETE ON meals BEGIN
+    UPDATE daily_nutrition SET
+        meal_count = meal_count - 1,
+        total_calories = total_calories - OLD.total_calories,
+        protein = protein - (SELECT COALESCE(SUM(protein), 0) FROM foods WHERE meal_id = OLD.id),
+        carbs = carbs - (SELECT COALESCE(SUM(carbs), 0) FROM foods WHERE meal_id = OLD.id),
+        fat = fat - (SELECT COALESCE(SUM(fat), 0) FROM foods WHERE meal_id = OLD.id),
+        fiber = fiber - (SELECT COALESCE(SUM(fiber), 0) FROM foods WHERE meal_id = OLD.id),
+        sugar = sugar - (SELECT COALESCE(SUM(sugar), 0) FROM foods WHERE meal_id = OLD.id),
+        sodium = sodium - (SELECT COALESCE(SUM(sodium), 0) FROM foods WHERE meal_id = OLD.id)
+    WHERE user_id = OLD.user_id AND date = OLD.date;
+    DELETE FROM daily_nutrition WHERE user_id = OLD.user_id AND date = OLD.date AND meal_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS meals_rollup_update AFTER UPDATE OF user_id, date, total_calories ON meals
+WHEN OLD.user_id IS NOT NEW.user_id OR OLD.date IS NOT NEW.date OR OLD.total_calories IS NOT NEW.total_calories
+BEGIN
+    -- Move the meal (and its foods) from the old day to the new one
+    UPDATE daily_nutrition SET
+        meal_count = meal_count - 1,
+        total_calories = total_calories - OLD.total_calories,
+        protein = protein - (SELECT COALESCE(SUM(protein), 0) FROM foods WHERE meal_id = OLD.id),
+        carbs = carbs - (SELECT COALESCE(SUM(carbs), 0) FROM foods WHERE meal_id = OLD.id),
+        fat = fat - (SELECT COALESCE(SUM(fat), 0) FROM foods WHERE meal_id = OLD.id),
+        fiber = fiber - (SELECT COALESCE(SUM(fiber), 0) FROM foods WHERE meal_id = OLD.id),
+        sugar = sugar - (SELECT COALESCE(SUM(sugar), 0) FROM foods WHERE meal_id = OLD.id),
+        sodium = sodium - (SELECT COALESCE(SUM(sodium), 0) FROM foods WHERE meal_id = OLD.id)
+    WHERE user_id = OLD.user_id AND date = OLD.date;
+    INSERT INTO daily_nutrition (user_id, date, meal_count, total_calories, protein, carbs, fat, fiber, sugar, sodium)
+    SELECT NEW.user_id, NEW.date, 1, NEW.total_calories, COALESCE(SUM(protein), 0), COALESCE(SUM(carbs), 0),
+           COALESCE(SUM(fat), 0), COALESCE(SUM(fiber), 0), COALESCE(SUM(sugar), 0), COALESCE(SUM(sodium), 0)
+    FROM foods WHERE meal_id = NEW.id
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        meal_count = meal_count + 1, total_calories = total_calories + excluded.total_calories,
+        protein = protein + excluded.protein, carbs = carbs + excluded.carbs, fat = fat + excluded.fat,
+        fiber = fiber + excluded.fiber, sugar = sugar + excluded.sugar, sodium = sodium + excluded.sodium;
+    DELETE FROM daily_nutrition WHERE user_id = OLD.user_id AND date = OLD.date AND meal_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS foods_rollup_insert AFTER INSERT ON foods BEGIN
+    UPDATE daily_nutrition SET
+        protein = protein + COALESCE(NEW.protein, 0), carbs = carbs + COALESCE(NEW.carbs, 0),
+        fat = fat + COALESCE(NEW.fat, 0), fiber = fiber + COALESCE(NEW.fiber, 0),
+        sugar = sugar + COALESCE(NEW.sugar, 0), sodium = sodium + COALESCE(NEW.sodium, 0)
+    WHERE (user_id, date) IN (SELECT user_id, date FROM meals WHERE id = NEW.meal_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS foods_rollup_delete AFTER DELETE ON foods BEGIN
+    UPDATE daily_nutrition SET
+        protein = protein - COALESCE(OLD.protein, 0), carbs = carbs - COALESCE(OLD.carbs, 0),
+        fat = fat - COALESCE(OLD.fat, 0), fiber = fiber - COALESCE(OLD.fiber, 0),
+        sugar = sugar - COALESCE(OLD.sugar, 0), sodium = sodium - COALESCE(OLD.sodium, 0)
+    WHERE (user_id, date) IN (SELECT user_id, date FROM meals WHERE id = OLD.meal_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS foods_rollup_update AFTER UPDATE OF meal_id, protein, carbs, fat, fiber, sugar, sodium ON foods
+BEGIN
+    UPDATE daily_nutrition SET
+        protein = protein - COALESCE(OLD.protein, 0), carbs = carbs - COALESCE(OLD.carbs, 0),
+        fat = fat - COALESCE(OLD.fat, 0), fiber = fiber - COALESCE(OLD.fiber, 0),
+        sugar = sugar - COALESCE(OLD.sugar, 0), sodium = sodium - COALESCE(OLD.sodium, 0)
+    WHERE (user_id, date) IN (SELECT user_id, date FROM meals WHERE id = OLD.meal_id);
+    UPDATE daily_nutrition SET
+        protein = protein + COALESCE(NEW.protein, 0), carbs = carbs + COALESCE(NEW.carbs, 0),
+        fat = fat + COALESCE(NEW.fat, 0), fiber = fiber + COALESCE(NEW.fiber, 0),
+        sugar = sugar + COALESCE(NEW.sugar, 0), sodium = sodium + COALESCE(NEW.sodium, 0)
+    WHERE (user_id, date) IN (SELECT user_id, date FROM meals WHERE id = NEW.meal_id);
+END;
+"""
+
+# Recompute the whole rollup from meals and foods (databases created before the rollup existed)
+REBUILD_ROLLUP_SQL = """
+INSERT INTO daily_nutrition (user_id, date, meal_count, total_calories, protein, carbs, fat, fiber, sugar, sodium)
+SELECT m.user_id, m.date, COUNT(*), SUM(m.total_calories),
+       COALESCE(SUM(mf.protein), 0), COALESCE(SUM(mf.carbs), 0), COALESCE(SUM(mf.fat), 0),
+       COALESCE(SUM(mf.fiber), 0), COALESCE(SUM(mf.sugar), 0), COALESCE(SUM(mf.sodium), 0)
+FROM meals m
+LEFT JOIN (
+    SELECT meal_id, SUM(protein) AS protein, SUM(carbs) AS carbs, SUM(fat) AS fat,
+           SUM(fiber) AS fiber, SUM(sugar) AS sugar, SUM(sodium) AS sodium
+    FROM foods
+    GROUP BY meal_id
+) mf ON mf.meal_id = m.id
+GROUP BY m.user_id, m.date
+"""
+
+# Rounded on read: repeated REAL additions and subtractions leave float residue
+DAILY_NUTRITION_COLUMNS = ("date, meal_count, total_calories, ROUND(protein, 2) AS protein, "
+                           "ROUND(carbs, 2) AS carbs, ROUND(fat, 2) AS fat, ROUND(fiber, 2) AS fiber, "
+                           "ROUND(sugar, 2) AS sugar, ROUND(sodium, 2) AS sodium")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _food_values(food: dict) -> dict:
+    # Portion columns are always derived from portion_size, so edits can't leave them stale
+    food = dict(food, **portion_fields(food["portion_size"], food["name"]))
+    return {col: food.get(col, default) for col, default in zip(UPDATE_COLUMNS, UPDATE_DEFAULTS)}
+
+
+def _food_record(meal_id: str, food: dict, created_at: str) -> tuple:
+    values = _food_values(food)
+    return (meal_id, created_at, str(uuid.uuid4()), *(values[col] for col in UPDATE_COLUMNS))
+
+
+class LocalStoreManager:
+    """SupabaseManager's meal interface backed by a local SQLite database"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self.conn = None
+        self._lock = threading.Lock()
+        self.initialize_client()
+
+    def initialize_client(self):
+        """Open the database and create tables and indexes if needed"""
+        try:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA foreign_keys = ON")
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.executescript(SCHEMA)
+            self._add_portion_columns()
+            self._create_rollup()
+            return True
+        except Exception as e:
+            st.error(f"Failed to open local database: {e}")
+            self.conn = None
+            return False
+
+    def _add_portion_columns(self):
+        """Add the normalized portion columns to foods tables created before they existed, filling them in"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(foods)")}
+        if set(PORTION_FIELDS) <= columns:
+            return
+        types = {"portion_quantity": "REAL", "portion_unit": "TEXT", "portion_grams": "REAL"}
+        with self.conn:
+            for column in PORTION_FIELDS:
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE foods ADD COLUMN {column} {types[column]}")
+            rows = self.conn.execute("SELECT id, name, portion_size FROM foods").fetchall()
+            self.conn.executemany(
+                f"UPDATE foods SET {', '.join(f'{col} = :{col}' for col in PORTION_FIELDS)} WHERE id = :id",
+                [dict(portion_fields(row["portion_size"], row["name"]), id=row["id"]) for row in rows]
+            )
+
+    def _create_rollup(self):
+        """Create the daily_nutrition rollup and its triggers, filling it from existing meals the first time"""
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_nutrition'").fetchone()
+        if not exists:
+            # One write transaction, so no meal can land between the rebuild and the triggers
+            self.conn.executescript(
+                f"BEGIN IMMEDIATE; {ROLLUP_SCHEMA}; DELETE FROM daily_nutrition; {REBUILD_ROLLUP_SQL}; COMMIT;")
+
+    def is_connected(self):
+        """Check if the database is open"""
+        return self.conn is not None
+
+    def _insert_foods(self, meal_id: str, foods: list, created_at: str):
+        self.conn.executemany(INSERT_FOOD_SQL, [_food_record(meal_id, food, created_at) for food in foods])
+
+    @timed("sqlite.save_meal", failed=lambda result: result is None)
+    def save_meal(self, meal_data: dict, photo_url: str = None, photo_status: str = None) -> str:
+        """Save meal and its foods in one transaction"""
+        try:
+            meal_id = str(uuid.uuid4())
+            now = _now()
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO meals (id, user_id, date, timestamp, meal_type, total_calories, notes, "
+                    "photo_url, photo_status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (meal_id, "default_user", meal_data["date"], meal_data["timestamp"], meal_data["meal_type"],
+                     meal_data["total_calories"], meal_data.get("notes", ""), photo_url, photo_status, now, now)
+                )
+                self._insert_foods(meal_id, meal_data["foods"], now)
+            return meal_id
+        except Exception as e:
+            st.error(f"Error saving meal: {e}")
+            return None
+
+    @timed("sqlite.get_meals")
+    def get_meals(self, start_date: date = None, end_date: date = None, meal_type: str = None,
+                  updated_since: str = None, before_date: str = None, limit: int = None):
+        """Retrieve meals with nested foods, newest date first (same filters as SupabaseManager)"""
+        try:
+            clauses = ["user_id = ?"]
+            params = ["default_user"]
+            if start_date:
+                clauses.append("date >= ?")
+                params.append(start_date.isoformat())
+            if end_date:
+                clauses.append("date <= ?")
+                params.append(end_date.isoformat())
+            if meal_type and meal_type != "All":
+                clauses.append("meal_type = ?")
+                params.append(meal_type)
+            if updated_since:
+                clauses.append("updated_at >= ?")
+                params.append(updated_since)
+            if before_date:
+                clauses.append("date < ?")
+                params.append(before_date)
+
+            sql = f"SELECT * FROM meals WHERE {' AND '.join(clauses)} ORDER BY date DESC, timestamp DESC"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+
+            with self._lock:
+                meals = [dict(row) for row in self.conn.execute(sql, params)]
+                foods_by_meal = {meal["id"]: [] for meal in meals}
+                meal_ids = list(foods_by_meal)
+                # Stay under SQLite's bound-parameter limit
+                for i in range(0, len(meal_ids), 500):
+                    chunk = meal_ids[i:i + 500]
+                    rows = self.conn.execute(
+                        f"SELECT meal_id, {', '.join(FOOD_COLUMNS)} FROM foods "
+                        f"WHERE meal_id IN ({', '.join('?' * len(chunk))}) ORDER BY created_at",
+                        chunk
+                    )
+                    for row in rows:
+                        food = dict(row)
+                        foods_by_meal[food.pop("meal_id")].append(food)
+
+            for meal in meals:
+                meal["foods"] = foods_by_meal[meal["id"]]
+            return meals
+
+        except Exception as e:
+            st.error(f"Error retrieving meals: {e}")
+            return []
+
+    @timed("sqlite.update_meal", failed=lambda result: not result)
+    def update_meal(self, meal_id: str, meal_data: dict):
+        """Update existing meal, writing only the foods that were added, changed or removed"""
+        try:
+            now = _now()
+            with self._lock, self.conn:
+                cursor = self.conn.execute(
+                    "UPDATE meals SET date = ?, meal_type = ?, total_calories = ?, notes = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (meal_data["date"], meal_data["meal_type"], meal_data["total_calories"],
+                     meal_data.get("notes", ""), now, meal_id)
+                )
+                if cursor.rowcount == 0:
+                    st.error("Failed to update meal")
+                    return False
+
+                current_ids = {row["id"] for row in self.conn.execute("SELECT id FROM foods WHERE meal_id = ?", (meal_id,))}
+                kept = [food for food in meal_data["foods"] if food.get("id") in current_ids]
+                new = [food for food in meal_data["foods"] if food.get("id") not in current_ids]
+
+                removed = current_ids - {food["id"] for food in kept}
+                self.conn.executemany("DELETE FROM foods WHERE id = ?", [(food_id,) for food_id in removed])
+                # Same as update_meal_with_foods: rewrite a food only when one of its values changed
+                self.conn.executemany(
+                    f"UPDATE foods SET {', '.join(f'{col} = :{col}' for col in UPDATE_COLUMNS)} "
+                    f"WHERE id = :id AND NOT ({' AND '.join(f'{col} IS :{col}' for col in UPDATE_COLUMNS)})",
+                    [dict(_food_values(food), id=food["id"]) for food in kept]
+                )
+                self._insert_foods(meal_id, new, now)
+            return True
+        except Exception as e:
+            st.error(f"Error updating meal: {e}")
+            return False
+
+    @timed("sqlite.delete_meal", failed=lambda result: not result)
+    def delete_meal(self, meal_id: str):
+        """Delete meal (foods are deleted by the cascade)"""
+        try:
+            with self._lock, self.conn:
+                cursor = self.conn.execute("DELETE FROM meals WHERE id = ?", (meal_id,))
+            return cursor.rowcount > 0
+        except Exception as e:
+            st.error(f"Error deleting meal: {e}")
+            return False
+
+    @timed("sqlite.get_daily_nutrition")
+    def get_daily_nutrition(self, start_date: date = None, end_date: date = None):
+        """Per-day calorie and macro totals, read from the daily_nutrition rollup"""
+        try:
+            params = {
+                "user": "default_user",
+                "start": start_date.isoformat() if start_date else "0000-01-01",
+                "end": end_date.isoformat() if end_date else "9999-12-31"
+            }
+            with self._lock:
+                return [dict(row) for row in self.conn.execute(
+                    f"SELECT {DAILY_NUTRITION_COLUMNS} FROM daily_nutrition "
+                    "WHERE user_id = :user AND date >= :start AND date <= :end ORDER BY date",
+                    params
+                )]
+        except Exception as e:
+            st.error(f"Error getting daily nutrition: {e}")
+            return []
+
+    @timed("sqlite.get_daily_totals")
+    def get_daily_totals(self, start_date: date = None, end_date: date = None):
+        """Get daily calorie totals"""
+        return {row["date"]: row["total_calories"] for row in self.get_daily_nutrition(start_date, end_date)}
+
+    @timed("sqlite.migrate_from_json")
+    def migrate_from_json(self, json_data: dict, progress=None):
+        """Import meals from the JSON history format in one transaction, skipping timestamps already stored"""
+        try:
+            now = _now()
+            with self._lock, self.conn:
+                seen = {row["timestamp"] for row in self.conn.execute(
+                    "SELECT timestamp FROM meals WHERE user_id = ?", ("default_user",))}
+                meals, foods = [], []
+                for meal in json_data.get("meals", []):
+                    if meal["timestamp"] in seen:
+                        continue
+                    seen.add(meal["timestamp"])
+                    meal_id = str(uuid.uuid4())
+                    meals.append((meal_id, "default_user", meal["date"], meal["timestamp"], meal["meal_type"],
+                                  meal["total_calories"], meal.get("notes", ""), now, now))
+                    foods.extend(_food_record(meal_id, food, now) for food in meal["foods"])
+                self.conn.executemany(
+                    "INSERT INTO meals (id, user_id, date, timestamp, meal_type, total_calories, notes, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    meals
+                )
+                self.conn.executemany(INSERT_FOOD_SQL, foods)
+            if progress:
+                progress(len(meals), len(meals))
+            return len(meals)
+        except Exception as e:
+            st.error(f"Error migrating data: {e}")
+            return 0
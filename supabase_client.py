@@ -4,11 +4,86 @@ Handles all database operations and photo storage
 """
 
 import streamlit as st
-from supabase import create_client, Client
-from datetime import datetime, date
+from supabase import Client
+from datetime import datetime, date, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
 import uuid
 import io
 from PIL import Image
+from image_processing import make_photo_variants
+from clients import get_supabase_client
+from local_storage import atomic_write_json
+from metrics import timed, record_size
+from portions import PORTION_FIELDS, portion_fields
+
+MIGRATION_BATCH_SIZE = 500  # Meals per save_meals_bulk call
+MIGRATION_WORKERS = 4
+MIGRATION_CHECKPOINT = ".migration_checkpoint.json"
+MIGRATION_NAMESPACE = uuid.UUID("6f1c3b52-8d4e-4c1a-9a8e-2b7d5e0f4c31")  # uuid5 namespace for migrated meal IDs
+
+
+def is_missing_function(error: Exception) -> bool:
+    """True if PostgREST rejected an RPC because the SQL function is not in the schema yet"""
+    message = str(error)
+    return "PGRST202" in message or "Could not find the function" in message
+
+
+def is_missing_table(error: Exception) -> bool:
+    """True if PostgREST rejected a query because the table is not in the schema yet"""
+    message = str(error)
+    return "PGRST205" in message or "42P01" in message or "Could not find the table" in message
+
+
+def is_missing_column(error: Exception) -> bool:
+    """True if PostgREST rejected a query because a column is not in the schema yet"""
+    message = str(error)
+    return "PGRST204" in message or "42703" in message
+
+
+def _utc_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp, reading naive values as UTC like timestamptz columns do"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+DAILY_NUTRITION_COLUMNS = "date, meal_count, total_calories, protein, carbs, fat, fiber, sugar, sodium"
+
+FOOD_FIELDS = ["name", "portion_size", "calories", "protein", "carbs", "fat",
+               "fiber", "sugar", "sodium", "confidence"]
+# Nested foods columns for get_meals, newest schema first
+MEAL_FOOD_SELECTS = [
+    ["id"] + FOOD_FIELDS + PORTION_FIELDS,
+    ["id"] + FOOD_FIELDS,
+    ["id", "name", "portion_size", "calories", "confidence"]
+]
+
+
+def without_portions(foods: list) -> list:
+    """Food rows minus the normalized portion columns, for schemas that predate them"""
+    return [{k: v for k, v in food.items() if k not in PORTION_FIELDS} for food in foods]
+
+
+def diff_foods(current: list, new: list):
+    """Split a meal's new food list into (inserts, updates, delete_ids) against its current rows
+
+    Foods are matched by id; an existing food is only an update if one of its values changed.
+    """
+    current_by_id = {food["id"]: food for food in current if food.get("id")}
+    inserts, updates = [], []
+    kept = set()
+    for food in new:
+        old = current_by_id.get(food.get("id"))
+        if old is None:
+            inserts.append(food)
+            continue
+        kept.add(old["id"])
+        if any(food.get(field) != old.get(field) for field in FOOD_FIELDS):
+            updates.append(food)
+    delete_ids = [food_id for food_id in current_by_id if food_id not in kept]
+    return inserts, updates, delete_ids
+
 
 class SupabaseManager:
     def __init__(self):
@@ -16,11 +91,11 @@ class SupabaseManager:
         self.initialize_client()
     
     def initialize_client(self):
-        """Initialize Supabase client with credentials from secrets"""
+        """Attach the shared Supabase client for the credentials in secrets"""
         try:
             supabase_url = st.secrets["SUPABASE_URL"]
             supabase_key = st.secrets["SUPABASE_ANON_KEY"]
-            self.client: Client = create_client(supabase_url, supabase_key)
+            self.client: Client = get_supabase_client(supabase_url, supabase_key)
             return True
         except Exception as e:
             st.error(f"Failed to connect to Supabase: {e}")
@@ -30,44 +105,109 @@ class SupabaseManager:
         """Check if Supabase client is properly initialized"""
         return self.client is not None
     
-    def upload_photo(self, image: Image.Image, meal_id: str) -> str:
+    def _upload_object(self, path: str, data: bytes):
+        """Upload (or overwrite) one object in the meal-photos bucket"""
+        record_size("photo_upload", len(data))
+        response = self.client.storage.from_("meal-photos").upload(
+            path,
+            data,
+            file_options={"content-type": "image/jpeg", "upsert": "true"}
+        )
+        
+        # Supabase Python client may return a response without status_code; no error means success
+        if hasattr(response, 'status_code') and response.status_code != 200:
+            raise RuntimeError(f"Failed to upload photo: {response}")
+    
+    def _store_variants(self, variants: dict, base_name: str) -> dict:
+        """Upload encoded variants as <base>.jpg, <base>_medium.jpg, <base>_thumb.jpg"""
+        photo_urls = {}
+        for variant, data in variants.items():
+            path = f"{base_name}.jpg" if variant == "full" else f"{base_name}_{variant}.jpg"
+            self._upload_object(path, data)
+            column = "photo_url" if variant == "full" else f"photo_{variant}_url"
+            photo_urls[column] = self.client.storage.from_("meal-photos").get_public_url(path)
+        return photo_urls
+    
+    @timed("supabase.store_photo")
+    def store_photo(self, image: Image.Image, meal_id: str) -> dict:
+        """Upload a meal photo with its medium and thumbnail variants (raises on failure)
+        
+        Returns the public URLs keyed by meals column: photo_url, photo_medium_url, photo_thumb_url
+        """
+        base_name = f"{meal_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return self._store_variants(make_photo_variants(image), base_name)
+    
+    @timed("supabase.upload_photo", failed=lambda result: result is None)
+    def upload_photo(self, image: Image.Image, meal_id: str) -> dict:
         """Upload meal photo to Supabase Storage"""
         try:
-            # Convert PIL Image to bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='JPEG', quality=85)
-            img_byte_arr.seek(0)
-            
-            # Generate unique filename
-            filename = f"{meal_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            
-            # Upload to Supabase Storage
-            response = self.client.storage.from_("meal-photos").upload(
-                filename, 
-                img_byte_arr.getvalue(),
-                file_options={"content-type": "image/jpeg"}
-            )
-            
-            # Check if upload was successful
-            if hasattr(response, 'status_code') and response.status_code == 200:
-                # Get public URL
-                photo_url = self.client.storage.from_("meal-photos").get_public_url(filename)
-                return photo_url
-            elif not hasattr(response, 'status_code'):
-                # Supabase Python client returns different response format
-                # If no error, assume success and get public URL
-                photo_url = self.client.storage.from_("meal-photos").get_public_url(filename)
-                return photo_url
-            else:
-                st.error(f"Failed to upload photo: {response}")
-                return None
-                
+            return self.store_photo(image, meal_id)
         except Exception as e:
             st.error(f"Error uploading photo: {e}")
             return None
     
-    def save_meal(self, meal_data: dict, photo_url: str = None) -> str:
-        """Save meal to Supabase database"""
+    @timed("supabase.set_photo_urls")
+    def set_photo_urls(self, meal_id: str, photo_urls: dict):
+        """Attach uploaded photo URLs to a saved meal (raises on failure)"""
+        self.client.table("meals").update({
+            **photo_urls,
+            "photo_status": "ready"
+        }).eq("id", meal_id).execute()
+    
+    @timed("supabase.mark_photo_failed")
+    def mark_photo_failed(self, meal_id: str):
+        """Record that a meal's background photo upload gave up (raises on failure)"""
+        self.client.table("meals").update({"photo_status": "failed"}).eq("id", meal_id).execute()
+    
+    def backfill_photo_variants(self, limit: int = None, progress=None) -> tuple:
+        """Generate thumbnail and medium variants for meals stored before variants existed
+        
+        progress, if given, is called as progress(done, total) after each meal. Returns
+        (backfilled count, [(meal_id, error message)] for meals that were skipped).
+        """
+        query = self.client.table("meals").select("id, photo_url") \
+            .not_.is_("photo_url", "null").is_("photo_thumb_url", "null")
+        if limit:
+            query = query.limit(limit)
+        meals = query.execute().data or []
+        
+        backfilled = 0
+        skipped = []
+        for index, meal in enumerate(meals, start=1):
+            try:
+                path = meal["photo_url"].split("/meal-photos/", 1)[1].split("?", 1)[0]
+                original = self.client.storage.from_("meal-photos").download(path)
+                variants = make_photo_variants(Image.open(io.BytesIO(original)))
+                del variants["full"]  # Keep the original object as is
+                photo_urls = self._store_variants(variants, path.rsplit(".", 1)[0])
+                self.client.table("meals").update(photo_urls).eq("id", meal["id"]).execute()
+                backfilled += 1
+            except Exception as e:
+                skipped.append((meal["id"], str(e)))
+            if progress:
+                progress(index, len(meals))
+        return backfilled, skipped
+    
+    def _food_records(self, meal_id: str, foods: list) -> list:
+        """Rows for the foods table"""
+        return [{
+            "meal_id": meal_id,
+            "name": food["name"],
+            "portion_size": food["portion_size"],
+            "calories": food["calories"],
+            "protein": food.get("protein", 0),
+            "carbs": food.get("carbs", 0),
+            "fat": food.get("fat", 0),
+            "fiber": food.get("fiber", 0),
+            "sugar": food.get("sugar", 0),
+            "sodium": food.get("sodium", 0),
+            "confidence": food.get("confidence", 100),
+            **portion_fields(food["portion_size"], food["name"])
+        } for food in foods]
+    
+    @timed("supabase.save_meal", failed=lambda result: result is None)
+    def save_meal(self, meal_data: dict, photo_url: str = None, photo_status: str = None) -> str:
+        """Save meal and its foods in one transaction (photo_status='pending' when a photo upload is queued)"""
         try:
             # Generate meal ID
             meal_id = str(uuid.uuid4())
@@ -83,30 +223,24 @@ class SupabaseManager:
                 "notes": meal_data.get("notes", ""),
                 "photo_url": photo_url
             }
+            if photo_status:
+                meal_record["photo_status"] = photo_status
+            foods_data = self._food_records(meal_id, meal_data["foods"])
+            
+            # Meal and foods in a single round trip and transaction
+            try:
+                self.client.rpc("save_meal_with_foods", {"p_meal": meal_record, "p_foods": foods_data}).execute()
+                return meal_id
+            except Exception as e:
+                if not is_missing_function(e):
+                    raise
             
-            # Insert meal
+            # Schema predates save_meal_with_foods: insert meal, then foods
             meal_response = self.client.table("meals").insert(meal_record).execute()
             
             if meal_response.data:
-                # Insert foods
-                foods_data = []
-                for food in meal_data["foods"]:
-                    foods_data.append({
-                        "meal_id": meal_id,
-                        "name": food["name"],
-                        "portion_size": food["portion_size"],
-                        "calories": food["calories"],
-                        "protein": food.get("protein", 0),
-                        "carbs": food.get("carbs", 0),
-                        "fat": food.get("fat", 0),
-                        "fiber": food.get("fiber", 0),
-                        "sugar": food.get("sugar", 0),
-                        "sodium": food.get("sodium", 0),
-                        "confidence": food.get("confidence", 100)
-                    })
-                
                 if foods_data:
-                    self.client.table("foods").insert(foods_data).execute()
+                    self.client.table("foods").insert(without_portions(foods_data)).execute()
                 
                 return meal_id
             else:
@@ -117,58 +251,53 @@ class SupabaseManager:
             st.error(f"Error saving meal: {e}")
             return None
     
-    def get_meals(self, start_date: date = None, end_date: date = None, meal_type: str = None):
-        """Retrieve meals from Supabase database"""
+    @timed("supabase.get_meals")
+    def get_meals(self, start_date: date = None, end_date: date = None, meal_type: str = None,
+                  updated_since: str = None, before_date: str = None, limit: int = None):
+        """Retrieve meals from Supabase database, newest date first
+        
+        updated_since limits results to rows changed at or after that timestamp. before_date
+        (ISO date, exclusive) and limit page through history by keyset on (user_id, date DESC).
+        """
         try:
-            # Try with nutrition columns first, fallback to basic if they don't exist
-            try:
-                query = self.client.table("meals").select("""
-                    *,
-                    foods (
-                        id,
-                        name,
-                        portion_size,
-                        calories,
-                        protein,
-                        carbs,
-                        fat,
-                        fiber,
-                        sugar,
-                        sodium,
-                        confidence
-                    )
-                """).eq("user_id", "default_user").order("timestamp", desc=True)
-            except Exception as e:
-                # Fallback to basic columns if nutrition columns don't exist
-                st.warning("Nutrition columns not found. Please update your database schema.")
-                query = self.client.table("meals").select("""
-                    *,
-                    foods (
-                        id,
-                        name,
-                        portion_size,
-                        calories,
-                        confidence
-                    )
-                """).eq("user_id", "default_user").order("timestamp", desc=True)
-            
-            # Apply filters
-            if start_date:
-                query = query.gte("date", start_date.isoformat())
-            if end_date:
-                query = query.lte("date", end_date.isoformat())
-            if meal_type and meal_type != "All":
-                query = query.eq("meal_type", meal_type)
-            
-            response = query.execute()
-            return response.data if response.data else []
+            # Newest schema first, falling back while PostgREST reports unknown food columns
+            for attempt, food_columns in enumerate(MEAL_FOOD_SELECTS):
+                if attempt == len(MEAL_FOOD_SELECTS) - 1:
+                    st.warning("Nutrition columns not found. Please update your database schema.")
+                query = self.client.table("meals").select(f"*, foods ({', '.join(food_columns)})") \
+                    .eq("user_id", "default_user")
+                
+                # Apply filters
+                if start_date:
+                    query = query.gte("date", start_date.isoformat())
+                if end_date:
+                    query = query.lte("date", end_date.isoformat())
+                if meal_type and meal_type != "All":
+                    query = query.eq("meal_type", meal_type)
+                if updated_since:
+                    query = query.gte("updated_at", updated_since)
+                if before_date:
+                    query = query.lt("date", before_date)
+                
+                query = query.order("date", desc=True).order("timestamp", desc=True)
+                if limit:
+                    query = query.limit(limit)
+                
+                try:
+                    response = query.execute()
+                except Exception as e:
+                    if not is_missing_column(e) or attempt == len(MEAL_FOOD_SELECTS) - 1:
+                        raise
+                    continue
+                return response.data if response.data else []
             
         except Exception as e:
             st.error(f"Error retrieving meals: {e}")
             return []
     
+    @timed("supabase.update_meal", failed=lambda result: not result)
     def update_meal(self, meal_id: str, meal_data: dict):
-        """Update existing meal in database"""
+        """Update existing meal, writing only the foods that were added, changed or removed"""
         try:
             # Update meal record
             meal_update = {
@@ -177,31 +306,39 @@ class SupabaseManager:
                 "total_calories": meal_data["total_calories"],
                 "notes": meal_data.get("notes", "")
             }
+            # Keep food IDs so unchanged rows are left alone
+            foods_data = [
+                dict(record, id=food["id"]) if food.get("id") else record
+                for food, record in zip(meal_data["foods"], self._food_records(meal_id, meal_data["foods"]))
+            ]
             
+            try:
+                response = self.client.rpc("update_meal_with_foods", {
+                    "p_meal_id": meal_id, "p_meal": meal_update, "p_foods": foods_data
+                }).execute()
+                if response.data is False:
+                    st.error("Failed to update meal")
+                    return False
+                return True
+            except Exception as e:
+                if not is_missing_function(e):
+                    raise
+            
+            # Schema predates update_meal_with_foods: diff against the stored foods client-side
             meal_response = self.client.table("meals").update(meal_update).eq("id", meal_id).execute()
             
             if meal_response.data:
-                # Delete existing foods and insert new ones
-                self.client.table("foods").delete().eq("meal_id", meal_id).execute()
-                
-                foods_data = []
-                for food in meal_data["foods"]:
-                    foods_data.append({
-                        "meal_id": meal_id,
-                        "name": food["name"],
-                        "portion_size": food["portion_size"],
-                        "calories": food["calories"],
-                        "protein": food.get("protein", 0),
-                        "carbs": food.get("carbs", 0),
-                        "fat": food.get("fat", 0),
-                        "fiber": food.get("fiber", 0),
-                        "sugar": food.get("sugar", 0),
-                        "sodium": food.get("sodium", 0),
-                        "confidence": food.get("confidence", 100)
-                    })
+                current = self.client.table("foods").select(", ".join(["id"] + FOOD_FIELDS)).eq("meal_id", meal_id).execute()
+                inserts, updates, delete_ids = diff_foods(current.data or [], without_portions(foods_data))
                 
-                if foods_data:
-                    self.client.table("foods").insert(foods_data).execute()
+                if delete_ids:
+                    self.client.table("foods").delete().in_("id", delete_ids).execute()
+                if updates:
+                    self.client.table("foods").upsert(updates).execute()
+                if inserts:
+                    self.client.table("foods").insert([
+                        {k: v for k, v in food.items() if k != "id"} for food in inserts
+                    ]).execute()
                 
                 return True
             else:
@@ -212,6 +349,7 @@ class SupabaseManager:
             st.error(f"Error updating meal: {e}")
             return False
     
+    @timed("supabase.delete_meal", failed=lambda result: not result)
     def delete_meal(self, meal_id: str):
         """Delete meal from database (foods will be deleted automatically due to CASCADE)"""
         try:
@@ -221,8 +359,62 @@ class SupabaseManager:
             st.error(f"Error deleting meal: {e}")
             return False
     
+    def _daily_rollup(self, columns: str, start_date: date = None, end_date: date = None):
+        """Read the trigger-maintained daily_nutrition table (raises on failure)"""
+        query = self.client.table("daily_nutrition").select(columns).eq("user_id", "default_user")
+        if start_date:
+            query = query.gte("date", start_date.isoformat())
+        if end_date:
+            query = query.lte("date", end_date.isoformat())
+        response = query.order("date").execute()
+        return response.data if response.data else []
+    
+    def _daily_nutrition_rpc(self, start_date: date = None, end_date: date = None):
+        """Call the get_daily_nutrition SQL function (raises on failure)"""
+        response = self.client.rpc("get_daily_nutrition", {
+            "p_user_id": "default_user",
+            "p_start_date": start_date.isoformat() if start_date else None,
+            "p_end_date": end_date.isoformat() if end_date else None
+        }).execute()
+        return response.data if response.data else []
+    
+    @timed("supabase.get_daily_nutrition")
+    def get_daily_nutrition(self, start_date: date = None, end_date: date = None):
+        """Get per-day calorie and macro totals from the daily_nutrition rollup"""
+        try:
+            return self._daily_rollup(DAILY_NUTRITION_COLUMNS, start_date, end_date)
+        except Exception as e:
+            if not is_missing_table(e):
+                st.error(f"Error getting daily nutrition: {e}")
+                return []
+        
+        # Schema predates the rollup table: aggregate at request time
+        try:
+            return self._daily_nutrition_rpc(start_date, end_date)
+        except Exception as e:
+            st.error(f"Error getting daily nutrition: {e}")
+            return []
+    
+    @timed("supabase.get_daily_totals")
     def get_daily_totals(self, start_date: date = None, end_date: date = None):
         """Get daily calorie totals"""
+        try:
+            rows = self._daily_rollup("date, total_calories", start_date, end_date)
+            return {row["date"]: row["total_calories"] for row in rows}
+        except Exception as e:
+            if not is_missing_table(e):
+                st.error(f"Error getting daily totals: {e}")
+                return {}
+        
+        try:
+            rows = self._daily_nutrition_rpc(start_date, end_date)
+            return {row["date"]: row["total_calories"] for row in rows}
+        except Exception as e:
+            if not is_missing_function(e):
+                st.error(f"Error getting daily totals: {e}")
+                return {}
+        
+        # Schema predates get_daily_nutrition: sum the meal rows client-side
         try:
             query = self.client.table("meals").select("date, total_calories").eq("user_id", "default_user")
             
@@ -247,25 +439,101 @@ class SupabaseManager:
             st.error(f"Error getting daily totals: {e}")
             return {}
     
-    def migrate_from_json(self, json_data: dict):
-        """Migrate existing JSON data to Supabase"""
+    def _migration_record(self, meal: dict) -> dict:
+        """Meal row for save_meals_bulk with nested foods; the ID is derived from the timestamp"""
+        return {
+            "id": str(uuid.uuid5(MIGRATION_NAMESPACE, f"default_user:{meal['timestamp']}")),
+            "user_id": "default_user",
+            "date": meal["date"],
+            "timestamp": meal["timestamp"],
+            "meal_type": meal["meal_type"],
+            "total_calories": meal["total_calories"],
+            "notes": meal.get("notes", ""),
+            "foods": [{k: v for k, v in food.items() if k != "meal_id"}
+                      for food in self._food_records(None, meal.get("foods", []))]
+        }
+    
+    def _save_meals_batch(self, records: list) -> int:
+        """Insert one batch of migrated meals, skipping ones already stored; returns meals inserted"""
         try:
-            migrated_count = 0
+            response = self.client.rpc("save_meals_bulk", {"p_meals": records}).execute()
+            return response.data or 0
+        except Exception as e:
+            if not is_missing_function(e):
+                raise
+        
+        # Schema predates save_meals_bulk: one bulk insert each for meals and foods
+        existing = self.client.table("meals").select("id, timestamp").eq("user_id", "default_user") \
+            .gte("timestamp", records[0]["timestamp"]).lte("timestamp", records[-1]["timestamp"]).execute()
+        existing_ids = {row["id"] for row in existing.data or []}
+        existing_times = {_utc_timestamp(row["timestamp"]) for row in existing.data or []}
+        new_records = [r for r in records
+                       if r["id"] not in existing_ids and _utc_timestamp(r["timestamp"]) not in existing_times]
+        if not new_records:
+            return 0
+        self.client.table("meals").insert([
+            {k: v for k, v in r.items() if k != "foods"} for r in new_records
+        ]).execute()
+        foods = [dict(food, meal_id=r["id"]) for r in new_records for food in without_portions(r["foods"])]
+        if foods:
+            self.client.table("foods").insert(foods).execute()
+        return len(new_records)
+    
+    @timed("supabase.migrate_from_json")
+    def migrate_from_json(self, json_data: dict, batch_size: int = MIGRATION_BATCH_SIZE,
+                          workers: int = MIGRATION_WORKERS, checkpoint_path: str = MIGRATION_CHECKPOINT,
+                          progress=None):
+        """Migrate existing JSON data to Supabase in concurrent batches
+        
+        Meals are deduplicated by timestamp. Finished batches are recorded in checkpoint_path,
+        so a rerun after a failure only sends what is left. progress(done, total) is called
+        as batches finish.
+        """
+        try:
+            # One meal per timestamp, oldest first so batches are stable between runs
+            by_timestamp = {}
             for meal in json_data.get("meals", []):
-                # Convert to Supabase format
-                meal_data = {
-                    "date": meal["date"],
-                    "timestamp": meal["timestamp"],
-                    "meal_type": meal["meal_type"],
-                    "total_calories": meal["total_calories"],
-                    "notes": meal.get("notes", ""),
-                    "foods": meal["foods"]
+                by_timestamp.setdefault(meal["timestamp"], meal)
+            records = [self._migration_record(by_timestamp[ts]) for ts in sorted(by_timestamp)]
+            batches = {
+                f"{batch[0]['timestamp']}|{batch[-1]['timestamp']}|{len(batch)}": batch
+                for batch in (records[i:i + batch_size] for i in range(0, len(records), batch_size))
+            }
+            
+            done_batches = set()
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path, "r") as f:
+                    done_batches = set(json.load(f).get("done", [])) & set(batches)
+            
+            total = len(records)
+            done = sum(len(batches[key]) for key in done_batches)
+            migrated_count = 0
+            failures = []
+            if progress:
+                progress(done, total)
+            
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate") as executor:
+                futures = {
+                    executor.submit(self._save_meals_batch, batch): key
+                    for key, batch in batches.items() if key not in done_batches
                 }
-                
-                meal_id = self.save_meal(meal_data)
-                if meal_id:
-                    migrated_count += 1
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        migrated_count += future.result()
+                    except Exception as e:
+                        failures.append(e)
+                        continue
+                    done_batches.add(key)
+                    done += len(batches[key])
+                    atomic_write_json(checkpoint_path, {"done": sorted(done_batches)})
+                    if progress:
+                        progress(done, total)
             
+            if failures:
+                st.error(f"Error migrating data: {len(failures)} batches failed ({failures[0]}); run again to resume")
+            elif os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
             return migrated_count
             
         except Exception as e:
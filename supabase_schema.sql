@@ -16,7 +16,7 @@ CREATE TABLE IF NOT EXISTS public.meals (
     notes TEXT,
     photo_url TEXT, -- URL to stored photo in Supabase Storage
     created_at TIMESTAMPTZ DEFAULT NOW(),
-    updated_at TIMESTAMPTZ DEFAULT NOW()
+    updated_at TIMESTAMPTZ DEFAULT clock_timestamp()
 );
 
 -- Create foods table (related to meals)
@@ -40,12 +40,15 @@ CREATE TABLE IF NOT EXISTS public.foods (
 CREATE INDEX IF NOT EXISTS idx_meals_user_date ON public.meals(user_id, date DESC);
 CREATE INDEX IF NOT EXISTS idx_meals_timestamp ON public.meals(timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_foods_meal_id ON public.foods(meal_id);
+CREATE INDEX IF NOT EXISTS idx_meals_user_updated_at ON public.meals(user_id, updated_at); -- incremental syncs
 
 -- Create updated_at trigger function
+-- clock_timestamp() rather than NOW() (the transaction's start), so a long transaction's rows
+-- are not stamped far below the sync watermark of the clients that read before it committed
 CREATE OR REPLACE FUNCTION public.update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
-    NEW.updated_at = NOW();
+    NEW.updated_at = clock_timestamp();
     RETURN NEW;
 END;
 $$ language 'plpgsql';
@@ -82,3 +85,389 @@ ADD COLUMN IF NOT EXISTS fat DECIMAL(8,2) DEFAULT 0,
 ADD COLUMN IF NOT EXISTS fiber DECIMAL(8,2) DEFAULT 0,
 ADD COLUMN IF NOT EXISTS sugar DECIMAL(8,2) DEFAULT 0,
 ADD COLUMN IF NOT EXISTS sodium DECIMAL(8,2) DEFAULT 0;
+
+-- Per-day calorie and macro totals aggregated in the database
+-- Foods are summed per meal first so meal calories are not multiplied by the join
+CREATE OR REPLACE FUNCTION public.get_daily_nutrition(
+    p_user_id TEXT DEFAULT 'default_user',
+    p_start_date DATE DEFAULT NULL,
+    p_end_date DATE DEFAULT NULL
+)
+RETURNS TABLE (
+    date DATE,
+    meal_count BIGINT,
+    total_calories BIGINT,
+    protein NUMERIC,
+    carbs NUMERIC,
+    fat NUMERIC,
+    fiber NUMERIC,
+    sugar NUMERIC,
+    sodium NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    WITH user_meals AS (
+        SELECT m.id, m.date, m.total_calories
+        FROM public.meals m
+        WHERE m.user_id = p_user_id
+          AND (p_start_date IS NULL OR m.date >= p_start_date)
+          AND (p_end_date IS NULL OR m.date <= p_end_date)
+    ),
+    meal_foods AS (
+        SELECT f.meal_id,
+               SUM(f.protein) AS protein,
+               SUM(f.carbs) AS carbs,
+               SUM(f.fat) AS fat,
+               SUM(f.fiber) AS fiber,
+               SUM(f.sugar) AS sugar,
+               SUM(f.sodium) AS sodium
+        FROM public.foods f
+        JOIN user_meals um ON um.id = f.meal_id
+        GROUP BY f.meal_id
+    )
+    SELECT um.date,
+           COUNT(*) AS meal_count,
+           SUM(um.total_calories) AS total_calories,
+           COALESCE(SUM(mf.protein), 0) AS protein,
+           COALESCE(SUM(mf.carbs), 0) AS carbs,
+           COALESCE(SUM(mf.fat), 0) AS fat,
+           COALESCE(SUM(mf.fiber), 0) AS fiber,
+           COALESCE(SUM(mf.sugar), 0) AS sugar,
+           COALESCE(SUM(mf.sodium), 0) AS sodium
+    FROM user_meals um
+    LEFT JOIN meal_foods mf ON mf.meal_id = um.id
+    GROUP BY um.date
+    ORDER BY um.date;
+$$;
+
+-- Photo upload state: 'pending' while a background upload is in flight
+ALTER TABLE public.meals
+ADD COLUMN IF NOT EXISTS photo_status TEXT CHECK (photo_status IN ('pending', 'ready', 'failed'));
+
+-- Existing databases: stamp inserts at statement time too (see update_updated_at_column)
+ALTER TABLE public.meals ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+
+-- Smaller photo variants generated at upload time (see backfill_thumbnails.py for older photos)
+ALTER TABLE public.meals
+ADD COLUMN IF NOT EXISTS photo_medium_url TEXT,
+ADD COLUMN IF NOT EXISTS photo_thumb_url TEXT;
+
+-- Portion normalized from portion_size by portions.py: quantity of unit ("2", "cup") and its
+-- weight in grams (NULL for counts like "1 medium" without a stated weight)
+ALTER TABLE public.foods
+ADD COLUMN IF NOT EXISTS portion_quantity NUMERIC,
+ADD COLUMN IF NOT EXISTS portion_unit TEXT,
+ADD COLUMN IF NOT EXISTS portion_grams NUMERIC;
+
+-- Insert a meal and its foods in one transaction (one round trip, no orphan meals)
+-- p_meal: meals columns as JSON; p_foods: JSON array of foods columns (meal_id is ignored)
+CREATE OR REPLACE FUNCTION public.save_meal_with_foods(p_meal JSONB, p_foods JSONB DEFAULT '[]'::JSONB)
+RETURNS UUID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_meal_id UUID := COALESCE((p_meal->>'id')::UUID, gen_random_uuid());
+BEGIN
+    INSERT INTO public.meals (id, user_id, date, timestamp, meal_type, total_calories, notes, photo_url, photo_status)
+    VALUES (
+        v_meal_id,
+        COALESCE(p_meal->>'user_id', 'default_user'),
+        (p_meal->>'date')::DATE,
+        COALESCE((p_meal->>'timestamp')::TIMESTAMPTZ, NOW()),
+        p_meal->>'meal_type',
+        ROUND(COALESCE((p_meal->>'total_calories')::NUMERIC, 0)),
+        p_meal->>'notes',
+        p_meal->>'photo_url',
+        p_meal->>'photo_status'
+    );
+
+    INSERT INTO public.foods (meal_id, name, portion_size, calories, protein, carbs, fat, fiber, sugar, sodium, confidence,
+                              portion_quantity, portion_unit, portion_grams)
+    SELECT v_meal_id, f.name, f.portion_size, ROUND(COALESCE(f.calories, 0)),
+           COALESCE(f.protein, 0), COALESCE(f.carbs, 0), COALESCE(f.fat, 0),
+           COALESCE(f.fiber, 0), COALESCE(f.sugar, 0), COALESCE(f.sodium, 0),
+           ROUND(COALESCE(f.confidence, 100)),
+           f.portion_quantity, f.portion_unit, f.portion_grams
+    FROM jsonb_to_recordset(COALESCE(p_foods, '[]'::JSONB)) AS f(
+        name TEXT, portion_size TEXT, calories NUMERIC, protein NUMERIC, carbs NUMERIC,
+        fat NUMERIC, fiber NUMERIC, sugar NUMERIC, sodium NUMERIC, confidence NUMERIC,
+        portion_quantity NUMERIC, portion_unit TEXT, portion_grams NUMERIC
+    );
+
+    RETURN v_meal_id;
+END;
+$$;
+
+-- Update a meal and apply only the food changes in one transaction
+-- p_foods is the complete new food list: rows with an id of this meal are updated when a
+-- value changed, rows without one are inserted, and the meal's other foods are deleted
+CREATE OR REPLACE FUNCTION public.update_meal_with_foods(p_meal_id UUID, p_meal JSONB, p_foods JSONB DEFAULT '[]'::JSONB)
+RETURNS BOOLEAN
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE public.meals SET
+        date = (p_meal->>'date')::DATE,
+        meal_type = p_meal->>'meal_type',
+        total_calories = ROUND(COALESCE((p_meal->>'total_calories')::NUMERIC, 0)),
+        notes = p_meal->>'notes'
+    WHERE id = p_meal_id;
+
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    -- One statement: the delete, update and insert touch disjoint rows
+    WITH new_foods AS (
+        SELECT f.id, f.name, f.portion_size,
+               ROUND(COALESCE(f.calories, 0))::INTEGER AS calories,
+               COALESCE(f.protein, 0)::DECIMAL(8,2) AS protein, COALESCE(f.carbs, 0)::DECIMAL(8,2) AS carbs,
+               COALESCE(f.fat, 0)::DECIMAL(8,2) AS fat, COALESCE(f.fiber, 0)::DECIMAL(8,2) AS fiber,
+               COALESCE(f.sugar, 0)::DECIMAL(8,2) AS sugar, COALESCE(f.sodium, 0)::DECIMAL(8,2) AS sodium,
+               ROUND(COALESCE(f.confidence, 100))::INTEGER AS confidence,
+               f.portion_quantity, f.portion_unit, f.portion_grams
+        FROM jsonb_to_recordset(COALESCE(p_foods, '[]'::JSONB)) AS f(
+            id UUID, name TEXT, portion_size TEXT, calories NUMERIC, protein NUMERIC, carbs NUMERIC,
+            fat NUMERIC, fiber NUMERIC, sugar NUMERIC, sodium NUMERIC, confidence NUMERIC,
+            portion_quantity NUMERIC, portion_unit TEXT, portion_grams NUMERIC
+        )
+    ),
+    removed AS (
+        DELETE FROM public.foods fd
+        WHERE fd.meal_id = p_meal_id
+          AND NOT EXISTS (SELECT 1 FROM new_foods nf WHERE nf.id = fd.id)
+    ),
+    changed AS (
+        UPDATE public.foods fd SET
+            name = nf.name, portion_size = nf.portion_size, calories = nf.calories,
+            protein = nf.protein, carbs = nf.carbs, fat = nf.fat, fiber = nf.fiber,
+            sugar = nf.sugar, sodium = nf.sodium, confidence = nf.confidence,
+            portion_quantity = nf.portion_quantity, portion_unit = nf.portion_unit, portion_grams = nf.portion_grams
+        FROM new_foods nf
+        WHERE fd.id = nf.id AND fd.meal_id = p_meal_id
+          AND (fd.name, fd.portion_size, fd.calories, fd.protein, fd.carbs, fd.fat,
+               fd.fiber, fd.sugar, fd.sodium, fd.confidence, fd.portion_quantity, fd.portion_unit, fd.portion_grams)
+              IS DISTINCT FROM
+              (nf.name, nf.portion_size, nf.calories, nf.protein, nf.carbs, nf.fat,
+               nf.fiber, nf.sugar, nf.sodium, nf.confidence, nf.portion_quantity, nf.portion_unit, nf.portion_grams)
+    )
+    -- Foods without an id (or with one from another meal) are new rows
+    INSERT INTO public.foods (meal_id, name, portion_size, calories, protein, carbs, fat, fiber, sugar, sodium, confidence,
+                              portion_quantity, portion_unit, portion_grams)
+    SELECT p_meal_id, nf.name, nf.portion_size, nf.calories, nf.protein, nf.carbs, nf.fat,
+           nf.fiber, nf.sugar, nf.sodium, nf.confidence, nf.portion_quantity, nf.portion_unit, nf.portion_grams
+    FROM new_foods nf
+    WHERE nf.id IS NULL
+       OR NOT EXISTS (SELECT 1 FROM public.foods fd WHERE fd.id = nf.id AND fd.meal_id = p_meal_id);
+
+    RETURN TRUE;
+END;
+$$;
+
+-- Bulk import for migrate_from_json: p_meals is a JSON array of meals, each with a nested
+-- "foods" array. Meals whose id or (user_id, timestamp) already exists are skipped, so
+-- re-running an interrupted migration is safe. Returns the number of meals inserted.
+CREATE OR REPLACE FUNCTION public.save_meals_bulk(p_meals JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    WITH incoming AS (
+        SELECT DISTINCT ON (COALESCE(m.user_id, 'default_user'), m.timestamp)
+               m.id, COALESCE(m.user_id, 'default_user') AS user_id, m.date, m.timestamp,
+               m.meal_type, m.total_calories, m.notes, m.foods
+        FROM jsonb_to_recordset(COALESCE(p_meals, '[]'::JSONB)) AS m(
+            id UUID, user_id TEXT, date DATE, timestamp TIMESTAMPTZ, meal_type TEXT,
+            total_calories NUMERIC, notes TEXT, foods JSONB
+        )
+    ),
+    inserted AS (
+        INSERT INTO public.meals (id, user_id, date, timestamp, meal_type, total_calories, notes)
+        SELECT i.id, i.user_id, i.date, i.timestamp, i.meal_type,
+               ROUND(COALESCE(i.total_calories, 0)), i.notes
+        FROM incoming i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM public.meals e WHERE e.user_id = i.user_id AND e.timestamp = i.timestamp
+        )
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id
+    ),
+    inserted_foods AS (
+        INSERT INTO public.foods (meal_id, name, portion_size, calories, protein, carbs, fat, fiber, sugar, sodium, confidence,
+                                  portion_quantity, portion_unit, portion_grams)
+        SELECT i.id, f.name, f.portion_size, ROUND(COALESCE(f.calories, 0)),
+               COALESCE(f.protein, 0), COALESCE(f.carbs, 0), COALESCE(f.fat, 0),
+               COALESCE(f.fiber, 0), COALESCE(f.sugar, 0), COALESCE(f.sodium, 0),
+               ROUND(COALESCE(f.confidence, 100)),
+               f.portion_quantity, f.portion_unit, f.portion_grams
+        FROM incoming i
+        JOIN inserted USING (id)
+        CROSS JOIN LATERAL jsonb_to_recordset(COALESCE(i.foods, '[]'::JSONB)) AS f(
+            name TEXT, portion_size TEXT, calories NUMERIC, protein NUMERIC, carbs NUMERIC,
+            fat NUMERIC, fiber NUMERIC, sugar NUMERIC, sodium NUMERIC, confidence NUMERIC,
+            portion_quantity NUMERIC, portion_unit TEXT, portion_grams NUMERIC
+        )
+    )
+    SELECT COUNT(*) INTO v_count FROM inserted;
+
+    RETURN v_count;
+END;
+$$;
+
+-- Per-day nutrition rollup, kept current by the triggers below so daily totals are read
+-- (one row per day) instead of summed at request time. Calories come from meals.total_calories,
+-- macros from foods, matching get_daily_nutrition.
+CREATE TABLE IF NOT EXISTS public.daily_nutrition (
+    user_id TEXT NOT NULL,
+    date DATE NOT NULL,
+    meal_count INTEGER NOT NULL DEFAULT 0,
+    total_calories BIGINT NOT NULL DEFAULT 0,
+    protein NUMERIC NOT NULL DEFAULT 0,
+    carbs NUMERIC NOT NULL DEFAULT 0,
+    fat NUMERIC NOT NULL DEFAULT 0,
+    fiber NUMERIC NOT NULL DEFAULT 0,
+    sugar NUMERIC NOT NULL DEFAULT 0,
+    sodium NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (user_id, date)
+);
+
+ALTER TABLE public.daily_nutrition ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow all operations for daily nutrition" ON public.daily_nutrition;
+CREATE POLICY "Allow all operations for daily nutrition" ON public.daily_nutrition
+    FOR ALL USING (user_id = 'default_user');
+
+-- Add a delta to one day's totals (concurrent writers add atomically under the row lock)
+-- and drop the day once its last meal is gone
+CREATE OR REPLACE FUNCTION public.apply_daily_nutrition(
+    p_user_id TEXT, p_date DATE, p_meals INTEGER, p_calories BIGINT, p_protein NUMERIC,
+    p_carbs NUMERIC, p_fat NUMERIC, p_fiber NUMERIC, p_sugar NUMERIC, p_sodium NUMERIC
+)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO public.daily_nutrition AS dn
+        (user_id, date, meal_count, total_calories, protein, carbs, fat, fiber, sugar, sodium)
+    VALUES (p_user_id, p_date, p_meals, p_calories, p_protein, p_carbs, p_fat, p_fiber, p_sugar, p_sodium)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        meal_count = dn.meal_count + EXCLUDED.meal_count,
+        total_calories = dn.total_calories + EXCLUDED.total_calories,
+        protein = dn.protein + EXCLUDED.protein,
+        carbs = dn.carbs + EXCLUDED.carbs,
+        fat = dn.fat + EXCLUDED.fat,
+        fiber = dn.fiber + EXCLUDED.fiber,
+        sugar = dn.sugar + EXCLUDED.sugar,
+        sodium = dn.sodium + EXCLUDED.sodium,
+        updated_at = NOW();
+
+    DELETE FROM public.daily_nutrition
+    WHERE user_id = p_user_id AND date = p_date AND meal_count <= 0;
+END;
+$$;
+
+-- Meals: a meal counts toward its day along with its foods. Deletes run BEFORE so the foods
+-- can still be summed; the cascaded food deletes then find no meal and change nothing.
+CREATE OR REPLACE FUNCTION public.meals_daily_nutrition()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    f RECORD;
+BEGIN
+    SELECT COALESCE(SUM(protein), 0) AS protein, COALESCE(SUM(carbs), 0) AS carbs,
+           COALESCE(SUM(fat), 0) AS fat, COALESCE(SUM(fiber), 0) AS fiber,
+           COALESCE(SUM(sugar), 0) AS sugar, COALESCE(SUM(sodium), 0) AS sodium
+    INTO f
+    FROM public.foods
+    WHERE meal_id = CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.apply_daily_nutrition(OLD.user_id, OLD.date, -1, -OLD.total_calories,
+            -f.protein, -f.carbs, -f.fat, -f.fiber, -f.sugar, -f.sodium);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.apply_daily_nutrition(NEW.user_id, NEW.date, 1, NEW.total_calories,
+            f.protein, f.carbs, f.fat, f.fiber, f.sugar, f.sodium);
+    END IF;
+    RETURN COALESCE(NEW, OLD);
+END;
+$$;
+
+DROP TRIGGER IF EXISTS meals_daily_nutrition_insert ON public.meals;
+CREATE TRIGGER meals_daily_nutrition_insert
+    AFTER INSERT ON public.meals
+    FOR EACH ROW
+    EXECUTE FUNCTION public.meals_daily_nutrition();
+
+DROP TRIGGER IF EXISTS meals_daily_nutrition_update ON public.meals;
+CREATE TRIGGER meals_daily_nutrition_update
+    AFTER UPDATE OF user_id, date, total_calories ON public.meals
+    FOR EACH ROW
+    WHEN ((OLD.user_id, OLD.date, OLD.total_calories) IS DISTINCT FROM (NEW.user_id, NEW.date, NEW.total_calories))
+    EXECUTE FUNCTION public.meals_daily_nutrition();
+
+DROP TRIGGER IF EXISTS meals_daily_nutrition_delete ON public.meals;
+CREATE TRIGGER meals_daily_nutrition_delete
+    BEFORE DELETE ON public.meals
+    FOR EACH ROW
+    EXECUTE FUNCTION public.meals_daily_nutrition();
+
+-- Foods: macros move with the food row, on the day of the meal it belongs to
+CREATE OR REPLACE FUNCTION public.foods_daily_nutrition()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.apply_daily_nutrition(m.user_id, m.date, 0, 0,
+            -COALESCE(OLD.protein, 0), -COALESCE(OLD.carbs, 0), -COALESCE(OLD.fat, 0),
+            -COALESCE(OLD.fiber, 0), -COALESCE(OLD.sugar, 0), -COALESCE(OLD.sodium, 0))
+        FROM public.meals m
+        WHERE m.id = OLD.meal_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM public.apply_daily_nutrition(m.user_id, m.date, 0, 0,
+            COALESCE(NEW.protein, 0), COALESCE(NEW.carbs, 0), COALESCE(NEW.fat, 0),
+            COALESCE(NEW.fiber, 0), COALESCE(NEW.sugar, 0), COALESCE(NEW.sodium, 0))
+        FROM public.meals m
+        WHERE m.id = NEW.meal_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS foods_daily_nutrition ON public.foods;
+CREATE TRIGGER foods_daily_nutrition
+    AFTER INSERT OR DELETE ON public.foods
+    FOR EACH ROW
+    EXECUTE FUNCTION public.foods_daily_nutrition();
+
+DROP TRIGGER IF EXISTS foods_daily_nutrition_update ON public.foods;
+CREATE TRIGGER foods_daily_nutrition_update
+    AFTER UPDATE OF meal_id, protein, carbs, fat, fiber, sugar, sodium ON public.foods
+    FOR EACH ROW
+    WHEN ((OLD.meal_id, OLD.protein, OLD.carbs, OLD.fat, OLD.fiber, OLD.sugar, OLD.sodium)
+          IS DISTINCT FROM (NEW.meal_id, NEW.protein, NEW.carbs, NEW.fat, NEW.fiber, NEW.sugar, NEW.sodium))
+    EXECUTE FUNCTION public.foods_daily_nutrition();
+
+-- Recompute the rollup from scratch (fills it for existing data; safe to re-run)
+CREATE OR REPLACE FUNCTION public.rebuild_daily_nutrition()
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Block writers so no trigger delta lands between the delete and the insert
+    LOCK TABLE public.meals, public.foods IN SHARE MODE;
+    DELETE FROM public.daily_nutrition;
+    INSERT INTO public.daily_nutrition (user_id, date, meal_count, total_calories, protein, carbs, fat, fiber, sugar, sodium)
+    SELECT m.user_id, m.date, COUNT(*), SUM(m.total_calories),
+           COALESCE(SUM(mf.protein), 0), COALESCE(SUM(mf.carbs), 0), COALESCE(SUM(mf.fat), 0),
+           COALESCE(SUM(mf.fiber), 0), COALESCE(SUM(mf.sugar), 0), COALESCE(SUM(mf.sodium), 0)
+    FROM public.meals m
+    LEFT JOIN (
+        SELECT meal_id, SUM(protein) AS protein, SUM(carbs) AS carbs, SUM(fat) AS fat,
+               SUM(fiber) AS fiber, SUM(sugar) AS sugar, SUM(sodium) AS sodium
+        FROM public.foods
+        GROUP BY meal_id
+    ) mf ON mf.meal_id = m.id
+    GROUP BY m.user_id, m.date;
+END;
+$$;
+
+SELECT public.rebuild_daily_nutrition();
@@ -0,0 +1,54 @@
+"""Tests for portions.parse_portion and rescale"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portions import parse_portion, rescale  # noqa: E402
+
+
+@pytest.mark.parametrize("text, quantity, unit, grams", [
+    ("150g", 150, "g", 150),
+    ("about 100g", 100, "g", 100),
+    ("~150 g", 150, "g", 150),
+    ("approx. 1 cup", 1, "cup", 240),
+    ("approximately 2 tbsp", 2, "tbsp", 29.58),
+    ("around 8 oz", 8, "oz", 226.8),
+    ("roughly 1/2 cup", 0.5, "cup", 120),
+    ("about a slice", 1, "slice", None),
+    ("1 medium (118g)", 1, "medium", 118),
+    ("2x", 2, "", None),
+    ("2 x 100g", 200, "g", 200),
+    ("x2", 2, "", None),
+    ("x 1.5", 1.5, "", None),
+    ("×3 slices", 3, "slice", None),
+])
+def test_parse_portion(text, quantity, unit, grams):
+    portion = parse_portion(text)
+    assert portion.quantity == pytest.approx(quantity)
+    assert portion.unit == unit
+    if grams is None:
+        assert portion.grams is None
+    else:
+        assert portion.grams == pytest.approx(grams)
+
+
+def test_rescale_qualified_portion():
+    food = {"name": "Chicken breast", "portion_size": "about 100g", "calories": 165, "protein": 31.0}
+    scaled = rescale(food, "150g")
+    assert scaled["calories"] == 248
+    assert scaled["protein"] == pytest.approx(46.5)
+
+
+def test_rescale_multiplier():
+    food = {"name": "White bread", "portion_size": "1 slice", "calories": 66, "protein": 1.9}
+    scaled = rescale(food, "x2")
+    assert scaled["calories"] == 132
+    assert scaled["protein"] == pytest.approx(3.8)
+
+
+def test_rescale_unrelated_units():
+    assert rescale({"name": "Apple", "portion_size": "1 medium", "calories": 95}, "200g") is None